@@ -3,10 +3,14 @@ Balanced algorithm - General purpose matching.
 """
 
 from algorithms.base import MatchingAlgorithm
-from utils.feature_extractors import extract_dominant_colors_fast, color_palette_distance_fast
+from utils.feature_extractors import (
+    extract_dominant_colors_fast, extract_color_histogram_counts, extract_ahash_u64,
+    color_palette_distance_fast, hash_distance_u64, hash_distance_u64_batch,
+    normalize_histogram, histogram_distance
+)
+from utils.feature_bank import FeatureBank, batch_results
 import numpy as np
-import imagehash
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 
 
 class BalancedAlgorithm(MatchingAlgorithm):
@@ -36,7 +40,7 @@ Optimal for most cases. Uses dominant colors (60%), color histogram (35%), and p
         features = {}
         
         # Perceptual hash
-        features['ahash'] = imagehash.average_hash(img, hash_size=8)
+        features['ahash_u64'] = extract_ahash_u64(img_array, hash_size=8)
         
         # Dominant colors
         dominant_colors, color_weights = extract_dominant_colors_fast(img_array, n_colors=12)
@@ -44,40 +48,83 @@ Optimal for most cases. Uses dominant colors (60%), color histogram (35%), and p
         features['color_weights'] = color_weights
         
         # Color histogram
-        bins = 24
-        hist, _ = np.histogramdd(
-            img_array.reshape(-1, 3),
-            bins=(bins, bins, bins),
-            range=[(0, 256), (0, 256), (0, 256)]
-        )
-        hist = hist.flatten()
-        hist = hist / (hist.sum() + 1e-10)
-        features['histogram'] = hist
+        features['hist_counts'], features['hist_total'] = extract_color_histogram_counts(img_array, bins=24)
         
         return features
     
     def calculate_similarity(self, target_features: Dict[str, Any], 
-                           candidate_features: Dict[str, Any]) -> Tuple[float, Dict[str, Any]]:
-        # Perceptual hash
-        hash_distance = float(target_features['ahash'] - candidate_features['ahash']) / 64.0
+                           candidate_features: Dict[str, Any],
+                           threshold: Optional[float] = None) -> Tuple[float, Dict[str, Any]]:
+        weights = self.weights
         
-        # Color palette
+        # Color palette first: cheap and carries the largest weight, so it is
+        # the best lower bound for rejecting candidates early
         color_distance = color_palette_distance_fast(
             target_features['dominant_colors'],
             target_features['color_weights'],
             candidate_features['dominant_colors'],
             candidate_features['color_weights']
         )
+        partial_distance = weights['dominant_colors'] * color_distance
+        if threshold is not None and partial_distance > threshold:
+            return float('inf'), {'color_dist': color_distance, 'early_exit': True, 'combined': float('inf')}
+        
+        # Perceptual hash
+        hash_distance = hash_distance_u64(target_features['ahash_u64'], candidate_features['ahash_u64'])
+        partial_distance += weights['perceptual_hash'] * hash_distance
+        if threshold is not None and partial_distance > threshold:
+            return float('inf'), {'color_dist': color_distance, 'hash_dist': hash_distance * 64,
+                                  'early_exit': True, 'combined': float('inf')}
         
         # Histogram
-        hist1 = target_features['histogram']
-        hist2 = candidate_features['histogram']
-        hist_distance = np.sum((hist1 - hist2) ** 2 / (hist1 + hist2 + 1e-10)) / 2
+        hist_distance = histogram_distance(target_features, candidate_features)
+        
+        return self._combine(hash_distance, color_distance, hist_distance)
+    
+    def calculate_similarity_batch(self, target_features: Dict[str, Any],
+                                   candidate_features_list: List[Dict[str, Any]],
+                                   use_gpu: bool = False) -> List[Tuple[float, Dict[str, Any]]]:
+        if not len(candidate_features_list):
+            return []
+        return batch_results(*self._batch_terms(target_features, candidate_features_list, use_gpu))
+        
+    def calculate_distances_batch(self, target_features: Dict[str, Any],
+                                  candidate_features_list: List[Dict[str, Any]],
+                                  use_gpu: bool = False) -> np.ndarray:
+        if not len(candidate_features_list):
+            return np.zeros(0)
+        return self._batch_terms(target_features, candidate_features_list, use_gpu)[0]
+    
+    def _batch_terms(self, target_features, candidate_features_list, use_gpu):
+        """Combined distances and per-metric arrays for all candidates, one numpy call per term."""
+        weights = self.weights
+        bank = FeatureBank.from_features(candidate_features_list)
+        target_histogram = normalize_histogram(target_features['hist_counts'], target_features['hist_total'])
+        hist_distances = bank.histogram_distances(target_histogram, use_gpu=use_gpu)
+        color_distances = bank.palette_distances(
+            target_features['dominant_colors'],
+            target_features['color_weights']
+        )
+        hash_distances = hash_distance_u64_batch(target_features['ahash_u64'], bank.ahashes)
         
+        combined_distances = (
+            weights['dominant_colors'] * color_distances +
+            weights['color_histogram'] * hist_distances +
+            weights['perceptual_hash'] * hash_distances
+        )
+        
+        return combined_distances, {
+            'hash_dist': hash_distances * 64,
+            'color_dist': color_distances,
+            'hist_dist': hist_distances
+        }
+    
+    def _combine(self, hash_distance, color_distance, hist_distance):
+        weights = self.weights
         combined_distance = (
-            self.weights['dominant_colors'] * color_distance +
-            self.weights['color_histogram'] * hist_distance +
-            self.weights['perceptual_hash'] * hash_distance
+            weights['dominant_colors'] * color_distance +
+            weights['color_histogram'] * hist_distance +
+            weights['perceptual_hash'] * hash_distance
         )
         
         metrics = {
@@ -3,7 +3,9 @@ Base class for all image matching algorithms.
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, List, Tuple, Optional
+
+import numpy as np
 
 
 class MatchingAlgorithm(ABC):
@@ -50,13 +52,17 @@ class MatchingAlgorithm(ABC):
     
     @abstractmethod
     def calculate_similarity(self, target_features: Dict[str, Any], 
-                           candidate_features: Dict[str, Any]) -> Tuple[float, Dict[str, Any]]:
+                           candidate_features: Dict[str, Any],
+                           threshold: Optional[float] = None) -> Tuple[float, Dict[str, Any]]:
         """
         Calculate similarity between two images based on their features.
         
         Args:
             target_features: Features from the target image
             candidate_features: Features from the candidate image
+            threshold: Optional cut-off (e.g. the current Kth-best distance).
+                Implementations may stop early and return float('inf') once
+                the distance is known to exceed it.
             
         Returns:
             Tuple of (combined_distance, metrics_dict)
@@ -64,6 +70,36 @@ class MatchingAlgorithm(ABC):
         """
         pass
     
+    def calculate_similarity_batch(self, target_features: Dict[str, Any],
+                                   candidate_features_list: List[Dict[str, Any]],
+                                   use_gpu: bool = False) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Calculate similarity between one target and many candidates.
+        
+        Algorithms can override this to vectorize across candidates; the
+        default simply calls calculate_similarity for each candidate.
+        candidate_features_list may also be a utils.feature_bank.FeatureBank,
+        which iterates as the original feature dicts. use_gpu is a hint that
+        vectorized implementations may run on the GPU if CuPy is available.
+        
+        Returns:
+            List of (combined_distance, metrics_dict), one per candidate
+        """
+        return [self.calculate_similarity(target_features, candidate_features)
+                for candidate_features in candidate_features_list]
+    
+    def calculate_distances_batch(self, target_features: Dict[str, Any],
+                                  candidate_features_list: List[Dict[str, Any]],
+                                  use_gpu: bool = False) -> np.ndarray:
+        """
+        Combined distance from one target to every candidate as an (N,) array,
+        without building per-candidate metrics. Vectorized algorithms override
+        this to return their weighted sum directly; the default takes it from
+        calculate_similarity_batch.
+        """
+        results = self.calculate_similarity_batch(target_features, candidate_features_list, use_gpu=use_gpu)
+        return np.array([distance for distance, _ in results], dtype=np.float64)
+    
     def requires_special_processing(self) -> bool:
         """Whether this algorithm needs special setup (e.g., AI models)."""
         return False
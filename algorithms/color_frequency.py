@@ -37,27 +37,29 @@ class ColorFrequencyAlgorithm(MatchingAlgorithm):
         # Reshape to list of pixels
         pixels = img_array.reshape(-1, 3)
         
-        # Count unique colors and their frequencies
-        unique_colors, counts = np.unique(pixels, axis=0, return_counts=True)
+        # Pack each pixel into one 24-bit code so the unique/count pass runs on a
+        # flat integer array instead of the much slower row-wise unique(axis=0)
+        codes = (pixels[:, 0].astype(np.uint32) << 16) | (pixels[:, 1].astype(np.uint32) << 8) | pixels[:, 2]
+        unique_codes, counts = np.unique(codes, return_counts=True)
         
         # Calculate total pixels
         total_pixels = len(pixels)
         
         # Create color frequency dictionary: {(r, g, b): frequency}
-        color_freq = {}
-        for color, count in zip(unique_colors, counts):
-            # Convert numpy integers to Python integers for serialization
-            color_tuple = tuple(int(c) for c in color)
-            frequency = float(count / total_pixels)
-            color_freq[color_tuple] = frequency
+        # tolist() gives Python ints/floats for serialization
+        frequencies = (counts / total_pixels).tolist()
+        color_freq = {
+            ((code >> 16) & 0xFF, (code >> 8) & 0xFF, code & 0xFF): frequency
+            for code, frequency in zip(unique_codes.tolist(), frequencies)
+        }
         
         return {
             'color_frequency': color_freq,
-            'unique_colors': int(len(unique_colors)),
+            'unique_colors': int(len(unique_codes)),
             'total_pixels': int(total_pixels)
         }
     
-    def calculate_similarity(self, features1: dict, features2: dict) -> tuple:
+    def calculate_similarity(self, features1: dict, features2: dict, threshold=None) -> tuple:
         """Calculate similarity based on color frequency distribution.
         
         Returns:
@@ -3,9 +3,13 @@ Render Match algorithm - Fast 3D render to 2D skin matching.
 """
 
 from algorithms.base import MatchingAlgorithm
-from utils.feature_extractors import extract_render_features, color_palette_distance_fast
+from utils.feature_extractors import (
+    extract_render_features, color_palette_distance_fast,
+    stack_palettes, color_palette_distance_batch
+)
+from utils.feature_bank import batch_results
 import numpy as np
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 
 
 class RenderMatchAlgorithm(MatchingAlgorithm):
@@ -39,7 +43,8 @@ SPECIFICALLY DESIGNED for matching 3D rendered characters to 2D skin files! Extr
         }
     
     def calculate_similarity(self, target_features: Dict[str, Any], 
-                           candidate_features: Dict[str, Any]) -> Tuple[float, Dict[str, Any]]:
+                           candidate_features: Dict[str, Any],
+                           threshold: Optional[float] = None) -> Tuple[float, Dict[str, Any]]:
         # Color palette matching
         palette_distance = color_palette_distance_fast(
             target_features['render_colors'],
@@ -53,6 +58,52 @@ SPECIFICALLY DESIGNED for matching 3D rendered characters to 2D skin files! Extr
         spatial2 = candidate_features['render_spatial']
         spatial_distance = np.linalg.norm(spatial1 - spatial2) / (np.linalg.norm(spatial1) + np.linalg.norm(spatial2) + 1e-10)
         
+        return self._combine(palette_distance, spatial_distance)
+    
+    def calculate_similarity_batch(self, target_features: Dict[str, Any],
+                                   candidate_features_list: List[Dict[str, Any]],
+                                   use_gpu: bool = False) -> List[Tuple[float, Dict[str, Any]]]:
+        if not len(candidate_features_list):
+            return []
+        return batch_results(*self._batch_terms(target_features, candidate_features_list))
+    
+    def calculate_distances_batch(self, target_features: Dict[str, Any],
+                                  candidate_features_list: List[Dict[str, Any]],
+                                  use_gpu: bool = False) -> np.ndarray:
+        if not len(candidate_features_list):
+            return np.zeros(0)
+        return self._batch_terms(target_features, candidate_features_list)[0]
+    
+    def _batch_terms(self, target_features, candidate_features_list):
+        """Combined distances and per-metric arrays for all candidates."""
+        candidates = list(candidate_features_list)
+        
+        # Stack all candidate palettes / grids once, then score them together
+        palettes = [c['render_colors'] for c in candidates]
+        colors_bank, valid_bank = stack_palettes(palettes, n_colors=max(len(p) for p in palettes))
+        palette_distances = color_palette_distance_batch(
+            target_features['render_colors'],
+            target_features['render_weights'],
+            colors_bank,
+            valid_bank
+        )
+        
+        spatial1 = target_features['render_spatial']
+        spatial_bank = np.stack([c['render_spatial'] for c in candidates])
+        spatial_distances = np.linalg.norm(spatial_bank - spatial1, axis=1) / \
+            (np.linalg.norm(spatial1) + np.linalg.norm(spatial_bank, axis=1) + 1e-10)
+        
+        combined_distances = (
+            self.weights['color_palette'] * palette_distances +
+            self.weights['spatial_pattern'] * spatial_distances
+        )
+        
+        return combined_distances, {
+            'palette_dist': palette_distances,
+            'spatial_dist': spatial_distances
+        }
+    
+    def _combine(self, palette_distance, spatial_distance):
         combined_distance = (
             self.weights['color_palette'] * palette_distance +
             self.weights['spatial_pattern'] * spatial_distance
@@ -5,7 +5,7 @@ Render to Skin algorithm - Converts renders to skins then compares visible regio
 from algorithms.base import MatchingAlgorithm
 from utils.feature_extractors import convert_render_to_skin, extract_visible_skin_regions
 import numpy as np
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Optional, Tuple
 
 
 class RenderToSkinAlgorithm(MatchingAlgorithm):
@@ -43,7 +43,8 @@ BEST FOR 3D RENDERS! First converts your 3D render to a 2D skin using region det
         return {'visible_regions': visible_regions}
     
     def calculate_similarity(self, target_features: Dict[str, Any], 
-                           candidate_features: Dict[str, Any]) -> Tuple[float, Dict[str, Any]]:
+                           candidate_features: Dict[str, Any],
+                           threshold: Optional[float] = None) -> Tuple[float, Dict[str, Any]]:
         target_regions = target_features['visible_regions']
         candidate_regions = candidate_features['visible_regions']
         
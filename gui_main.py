@@ -7,6 +7,7 @@ import sys
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
 import threading
+import multiprocessing
 from pathlib import Path
 import subprocess
 import urllib.request
@@ -1618,6 +1619,10 @@ Quick color-based matching using smaller histograms. Faster but less accurate. G
 
 
 if __name__ == "__main__":
+    # Must come first: in the frozen exe, matcher worker processes re-run
+    # this script and are diverted here instead of starting another GUI
+    multiprocessing.freeze_support()
+    
     import argparse
     
     parser = argparse.ArgumentParser(description=f"{__app_name__} v{__version__}")
@@ -0,0 +1,143 @@
+"""
+Candidate features stacked into contiguous arrays for batch scoring.
+
+Each candidate's features are a dict of small numpy arrays. Scoring one target
+against many candidates is much faster when the same feature of all candidates
+sits in one (M, ...) array, so distances are computed in a single numpy call.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from utils import feature_extractors
+from utils.feature_extractors import (
+    stack_palettes, palette_sq_norms, color_palette_distance_batch, chi_square_distance_batch,
+    hellinger_distance_batch, normalize_feature_rows, HIST_EPSILON
+)
+
+
+@dataclass
+class FeatureBank:
+    """Features of M candidates, one row per candidate.
+    
+    Array fields are None when not every candidate has that feature. The
+    original dicts are kept in `features` for per-candidate fallbacks, and
+    iterating a bank yields them, so it can be passed wherever a list of
+    feature dicts is expected.
+    """
+    features: List[Dict[str, Any]]
+    histograms: Optional[np.ndarray] = None       # (M, bins**3) float32, normalized
+    dominant_colors: Optional[np.ndarray] = None  # (M, n_colors, 3) float32
+    color_valid: Optional[np.ndarray] = None      # (M, n_colors) bool, False for padding
+    color_weights: Optional[np.ndarray] = None    # (M, n_colors) float32
+    color_sq_norms: Optional[np.ndarray] = None   # (M, n_colors) float32, |color|^2
+    ahashes: Optional[np.ndarray] = None          # (M,) uint64
+    texture_patterns: Optional[np.ndarray] = None # (M, k) float32
+    ai_features: Optional[np.ndarray] = None      # (M, D) float32, unit rows
+    mobile_features: Optional[np.ndarray] = None  # (M, D) float32, unit rows
+    # Score histograms with the Hellinger surrogate instead of chi-squared
+    approximate_histograms: bool = False
+    sqrt_histograms: Optional[np.ndarray] = None  # (M, bins**3) float32, on the first approximate query
+    # CuPy copy of histograms, uploaded on the first GPU query
+    histograms_gpu: Any = field(default=None, repr=False)
+    
+    def __len__(self):
+        return len(self.features)
+    
+    def __iter__(self):
+        return iter(self.features)
+    
+    def histogram_distances(self, target_hist, use_gpu=False):
+        """Chi-squared distance from a normalized target histogram to every candidate.
+        
+        With use_gpu=True the histogram matrix is kept on the GPU (CuPy) and
+        reused by later queries, but only for banks of at least
+        GPU_MIN_BANK_BYTES; smaller banks are faster on the CPU.
+        
+        Banks built with approximate_histograms=True return the squared
+        Hellinger distance instead (one matrix-vector product, within a
+        factor of two of chi-squared: hellinger <= chi_square <= 2 * hellinger).
+        """
+        if self.approximate_histograms:
+            if self.sqrt_histograms is None:
+                self.sqrt_histograms = np.sqrt(self.histograms)
+            return hellinger_distance_batch(np.sqrt(target_hist), self.sqrt_histograms)
+        if (use_gpu and feature_extractors.CUPY_AVAILABLE
+                and self.histograms.nbytes >= feature_extractors.GPU_MIN_BANK_BYTES):
+            if self.histograms_gpu is None:
+                self.histograms_gpu = feature_extractors.cp.asarray(self.histograms)
+            return feature_extractors.chi_square_distance_batch_gpu(target_hist, self.histograms_gpu)
+        return chi_square_distance_batch(target_hist, self.histograms)
+    
+    def palette_distances(self, colors1, weights1):
+        """Palette distance from one palette to every candidate's dominant colors."""
+        return color_palette_distance_batch(colors1, weights1, self.dominant_colors, self.color_valid,
+                                            bank_sq_norms=self.color_sq_norms)
+    
+    @classmethod
+    def from_features(cls, candidates, n_colors=12, approximate_histograms=False):
+        """
+        Build a bank from a list of feature dicts (a bank is returned as is).
+        approximate_histograms trades exact chi-squared histogram distances for
+        a much cheaper Hellinger surrogate (see histogram_distances).
+        """
+        if isinstance(candidates, cls):
+            return candidates
+        
+        features = list(candidates)
+        bank = cls(features=features, approximate_histograms=approximate_histograms)
+        if not features:
+            return bank
+        
+        def has(key):
+            return all(key in f for f in features)
+        
+        if has('hist_counts'):
+            # Rows are written straight into the float32 matrix (no integer
+            # stack to convert) and normalized once here instead of per comparison
+            totals = np.array([f['hist_total'] for f in features], dtype=np.float32)
+            bank.histograms = np.empty((len(features), len(features[0]['hist_counts'])), dtype=np.float32)
+            for i, f in enumerate(features):
+                bank.histograms[i] = f['hist_counts']
+            bank.histograms *= (1 / (totals + HIST_EPSILON))[:, np.newaxis]
+        
+        if has('dominant_colors') and has('color_weights'):
+            bank.dominant_colors, bank.color_valid = stack_palettes(
+                [f['dominant_colors'] for f in features], n_colors=n_colors)
+            # Query-independent half of |a-b|^2, computed once per bank
+            bank.color_sq_norms = palette_sq_norms(bank.dominant_colors)
+            # Weights go into the same slots as their colors
+            lengths = bank.color_valid.sum(axis=1)
+            bank.color_weights = np.zeros((len(features), n_colors), dtype=np.float32)
+            if lengths.any():
+                bank.color_weights[bank.color_valid] = np.concatenate(
+                    [f['color_weights'][:n] for f, n in zip(features, lengths) if n])
+        
+        if has('ahash_u64'):
+            bank.ahashes = np.array([f['ahash_u64'] for f in features], dtype=np.uint64)
+        
+        if has('texture_pattern'):
+            bank.texture_patterns = np.stack([f['texture_pattern'] for f in features]).astype(np.float32, copy=False)
+        
+        # Normalized once so each query is one matrix-vector product
+        if all(f.get('ai_available') for f in features):
+            bank.ai_features = normalize_feature_rows(np.stack([f['ai_features'] for f in features]))
+        if all(f.get('mobile_available') for f in features):
+            bank.mobile_features = normalize_feature_rows(np.stack([f['mobile_features'] for f in features]))
+        
+        return bank
+
+
+def batch_results(combined, terms):
+    """
+    Per-candidate (distance, metrics) list from vectorized scores: combined is
+    the (M,) distance array and terms maps each metric name to an (M,) array.
+    """
+    names = list(terms)
+    columns = [np.broadcast_to(terms[name], np.shape(combined)).tolist() for name in names]
+    return [
+        (distance, dict(zip(names, values), combined=distance))
+        for distance, *values in zip(np.asarray(combined).tolist(), *columns)
+    ]
@@ -0,0 +1,170 @@
+"""
+On-disk cache for extracted image features.
+
+Entries are stored as .npz files keyed by a hash of the image bytes, the
+algorithm and CACHE_VERSION, so a modified file is simply re-extracted on the
+next run, while moved or duplicated files reuse the same entry. The cache is
+kept under CACHE_MAX_BYTES by prune_cache, which drops the least recently
+used entries. Digests are memoized per (path, mtime, size), so looking up
+an unchanged file again, or saving right after a miss, doesn't re-read it.
+Only features made of numpy arrays and plain scalars are cached; anything
+else (PIL images, dicts) makes the entry uncacheable.
+"""
+
+from functools import lru_cache
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+CACHE_DIR = Path(os.path.expanduser("~")) / ".skin_lookup" / "feature_cache"
+
+# Bump whenever the stored features change layout or meaning; entries of
+# other versions are never read and are deleted by prune_cache
+CACHE_VERSION = 2
+_ENTRY_SUFFIX = f"_v{CACHE_VERSION}.npz"
+
+# prune_cache trims the cache to CACHE_PRUNE_RATIO of this size once it grows
+# past it, so it doesn't have to delete a few entries after every run
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+CACHE_PRUNE_RATIO = 0.8
+
+# Files whose content digest is remembered in memory (about 300 bytes each)
+DIGEST_INDEX_SIZE = 16384
+
+# Added back on load instead of being stored
+_SKIPPED_KEYS = ('algorithm', 'path')
+
+# Network features that failed or were unavailable (no torch) are not cached,
+# so the file gets them once the network works
+_MODEL_FLAGS = ('ai_available', 'mobile_available')
+
+
+def _feature_cache_path(image_path, algorithm):
+    """Cache file for an image's contents, or None if the image can't be read."""
+    try:
+        stat = os.stat(image_path)
+        digest = _file_digest(image_path, stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+    return CACHE_DIR / f"{digest}_{algorithm}{_ENTRY_SUFFIX}"
+
+
+@lru_cache(maxsize=DIGEST_INDEX_SIZE)
+def _file_digest(image_path, mtime_ns, size):
+    """Hash of a file's contents, memoized while its mtime and size are unchanged."""
+    with open(image_path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+
+def load_features(image_path, algorithm):
+    """Return cached features for an image, or None on a cache miss."""
+    cache_path = _feature_cache_path(image_path, algorithm)
+    if cache_path is None or not cache_path.exists():
+        return None
+    
+    try:
+        with np.load(cache_path, allow_pickle=False) as data:
+            features = {}
+            for key in data.files:
+                value = data[key]
+                # Scalars were stored as 0-d arrays
+                features[key] = value.item() if value.ndim == 0 else value
+    except Exception:
+        # Truncated or corrupt entry (BadZipFile, EOFError, ...): drop it so
+        # the features are extracted and stored again
+        _remove(cache_path)
+        return None
+    
+    # Marks the entry as recently used for prune_cache
+    try:
+        os.utime(cache_path)
+    except OSError:
+        pass
+    
+    features['algorithm'] = algorithm
+    features['path'] = image_path
+    return features
+
+
+def save_features(image_path, algorithm, features):
+    """Store features on disk. Returns False if they can't be cached."""
+    if any(features.get(flag) is False for flag in _MODEL_FLAGS):
+        return False
+    
+    arrays = {}
+    for key, value in features.items():
+        if key in _SKIPPED_KEYS:
+            continue
+        if isinstance(value, np.ndarray):
+            if value.dtype == object:
+                return False
+            arrays[key] = value
+        elif isinstance(value, (bool, int, float, np.generic)):
+            arrays[key] = np.asarray(value)
+        else:
+            return False
+    
+    cache_path = _feature_cache_path(image_path, algorithm)
+    if cache_path is None:
+        return False
+    
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file first so readers never see a partial entry
+        tmp_path = cache_path.with_name(cache_path.name + f".{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        return False
+    return True
+
+
+def prune_cache(max_bytes=CACHE_MAX_BYTES):
+    """
+    Delete entries of other cache versions, then, if the cache is larger than
+    max_bytes, the least recently used entries until it is down to
+    CACHE_PRUNE_RATIO of max_bytes. Returns the number of files deleted.
+    """
+    entries = []
+    removed = 0
+    try:
+        with os.scandir(CACHE_DIR) as scan:
+            for entry in scan:
+                if not entry.name.endswith('.npz'):
+                    continue
+                if not entry.name.endswith(_ENTRY_SUFFIX):
+                    removed += _remove(entry.path)
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return removed
+    
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        return removed
+    
+    entries.sort()
+    target = max_bytes * CACHE_PRUNE_RATIO
+    for _, size, path in entries:
+        if total <= target:
+            break
+        if _remove(path):
+            total -= size
+            removed += 1
+    return removed
+
+
+def _remove(path):
+    """Delete a cache file, ignoring errors. Returns True if it was deleted."""
+    try:
+        os.remove(path)
+    except OSError:
+        return False
+    return True
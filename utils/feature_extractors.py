@@ -3,9 +3,10 @@ Feature extraction functions for image matching.
 Shared by all matching algorithms.
 """
 
+import importlib.util
+
 import numpy as np
 from PIL import Image, ImageFilter
-import imagehash
 
 # Optional imports
 try:
@@ -14,90 +15,294 @@ try:
 except ImportError:
     CV2_AVAILABLE = False
 
+# SSIM is computed in NumPy (see ssim_index); scikit-image is no longer needed.
+# The flag is kept for code that still checks it.
+SSIM_AVAILABLE = True
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 try:
-    from skimage.metrics import structural_similarity as ssim
-    SSIM_AVAILABLE = True
+    import cupy as cp
+    CUPY_AVAILABLE = cp.cuda.is_available()
 except ImportError:
-    SSIM_AVAILABLE = False
+    CUPY_AVAILABLE = False
 
 try:
     import torch
     import torchvision.models as models
-    import torchvision.transforms as transforms
+    # v2 transforms work on (C, H, W) tensors, so preprocessing can run on the GPU
+    import torchvision.transforms.v2 as transforms
     TORCH_AVAILABLE = True
     print(f"[INFO] PyTorch {torch.__version__} loaded successfully (CUDA: {torch.cuda.is_available()})")
     
+    # Input sizes are fixed, so let cuDNN benchmark and cache the fastest conv kernels
+    torch.backends.cudnn.benchmark = True
+    # Let FP32 matmuls/convs use TF32 Tensor Cores on Ampere and newer GPUs
+    torch.set_float32_matmul_precision('high')
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+    
+    # torch.compile's GPU backend generates Triton kernels; without Triton
+    # (e.g. on Windows) or on CPU the models are traced with TorchScript instead
+    TORCH_COMPILE_AVAILABLE = (hasattr(torch, 'compile') and torch.cuda.is_available()
+                               and importlib.util.find_spec('triton') is not None)
+    
+    # Both networks take 256x256 inputs after their transforms
+    MODEL_INPUT_SIZE = 256
+    
+    def _inference_device():
+        """Device the feature models run on, and their dtype (FP16 on CUDA)."""
+        if torch.cuda.is_available():
+            return torch.device('cuda'), torch.float16
+        return torch.device('cpu'), torch.float32
+    
+    def _compile_model(model):
+        """
+        Fuse the model's kernels: torch.compile with CUDA graphs when supported,
+        otherwise a frozen TorchScript trace (conv+BN folding, oneDNN on CPU).
+        Falls back to the eager model if tracing fails.
+        """
+        if TORCH_COMPILE_AVAILABLE:
+            return torch.compile(model, mode='reduce-overhead', fullgraph=True)
+        
+        device, dtype = _inference_device()
+        memory_format = torch.channels_last if device.type == 'cuda' else torch.contiguous_format
+        example = torch.zeros((1, 3, MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), device=device, dtype=dtype)
+        try:
+            with torch.no_grad():
+                traced = torch.jit.trace(model, example.contiguous(memory_format=memory_format))
+            return torch.jit.optimize_for_inference(traced)
+        except Exception as e:
+            print(f"[WARNING] TorchScript optimization failed, running eagerly: {e}")
+            return model
+    
+    def _normalization(mean, std):
+        """
+        (scale, shift) tensors on the model device, shaped (1, 3, 1, 1), so
+        batch * scale + shift maps 0-255 pixels straight to normalized inputs
+        in one fused op. Kept in float32; the result is cast to the model dtype.
+        """
+        device, _ = _inference_device()
+        mean = torch.tensor(mean, device=device).view(1, 3, 1, 1)
+        std = torch.tensor(std, device=device).view(1, 3, 1, 1)
+        return 1.0 / (255.0 * std), -mean / std
+    
     # Initialize models globally to avoid reloading
     _ai_model = None
     _ai_transform = None
+    _ai_normalization = None
     _mobile_model = None
     _mobile_transform = None
+    _mobile_normalization = None
     
     def _get_ai_model():
-        global _ai_model, _ai_transform
+        global _ai_model, _ai_transform, _ai_normalization
         if _ai_model is None:
             _ai_model = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1)
             _ai_model.eval()
+            _ai_model.requires_grad_(False)
             _ai_model = torch.nn.Sequential(*list(_ai_model.children())[:-1])
             
-            device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-            _ai_model = _ai_model.to(device)
-            print(f"[INFO] ResNet18 model loaded on device: {device}")
+            device, dtype = _inference_device()
+            _ai_model = _ai_model.to(device, dtype=dtype)
+            if device.type == 'cuda':
+                # NHWC lets cuDNN's FP16 Tensor Core kernels skip layout transposes
+                _ai_model = _ai_model.to(memory_format=torch.channels_last)
+            _ai_model = _compile_model(_ai_model)
+            print(f"[INFO] ResNet18 model loaded on device: {device} (FP16: {device.type == 'cuda'})")
             
+            # Geometry only; pixels stay 0-255 until _ai_normalization is applied to the batch
             _ai_transform = transforms.Compose([
-                transforms.Resize((256, 256), interpolation=transforms.InterpolationMode.NEAREST),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
+                transforms.ToDtype(torch.float32),
+                # NEAREST_EXACT samples pixel centers like PIL's NEAREST
+                transforms.Resize((MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), interpolation=transforms.InterpolationMode.NEAREST_EXACT)
             ])
-        return _ai_model, _ai_transform
+            _ai_normalization = _normalization(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5])
+        return _ai_model, _ai_transform, _ai_normalization
     
     def _get_mobile_model():
-        global _mobile_model, _mobile_transform
+        global _mobile_model, _mobile_transform, _mobile_normalization
         if _mobile_model is None:
             _mobile_model = models.resnet50(weights=models.ResNet50_Weights.IMAGENET1K_V2)
             _mobile_model.eval()
+            _mobile_model.requires_grad_(False)
             _mobile_model = torch.nn.Sequential(*list(_mobile_model.children())[:-1])
             
-            device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-            _mobile_model = _mobile_model.to(device)
+            device, dtype = _inference_device()
+            _mobile_model = _mobile_model.to(device, dtype=dtype)
             if device.type == 'cuda':
-                _mobile_model = _mobile_model.half()
+                _mobile_model = _mobile_model.to(memory_format=torch.channels_last)
+            _mobile_model = _compile_model(_mobile_model)
             print(f"[INFO] ResNet50 model loaded on device: {device} (FP16: {device.type == 'cuda'})")
             
             _mobile_transform = transforms.Compose([
-                transforms.Resize((288, 288), interpolation=transforms.InterpolationMode.BILINEAR),
-                transforms.CenterCrop(256),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+                transforms.ToDtype(torch.float32),
+                transforms.Resize((288, 288), interpolation=transforms.InterpolationMode.BILINEAR, antialias=True),
+                transforms.CenterCrop(MODEL_INPUT_SIZE)
             ])
-        return _mobile_model, _mobile_transform
+            _mobile_normalization = _normalization(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+        return _mobile_model, _mobile_transform, _mobile_normalization
     
 except ImportError as e:
     TORCH_AVAILABLE = False
+    TORCH_COMPILE_AVAILABLE = False
     print(f"[WARNING] PyTorch import failed: {e}")
 
 
+# Histograms are stored as float32; keep the epsilon float32 too so the
+# chi-squared math never upcasts to float64
+HIST_EPSILON = np.float32(1e-10)
+
+# ITU-R 601 luma, as used by PIL's convert('L')
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# Below this candidate-bank size the host/device copies outweigh the GPU speedup.
+# About 1200 histogram rows, so only large prebuilt banks scored through
+# batch_calculate_similarity / batch_calculate_distances(use_gpu=True) reach
+# it; find_matching_skins scores much smaller batches and stays on the CPU.
+GPU_MIN_BANK_BYTES = 64 * 1024 * 1024
+
+# Largest RGB distance, used to scale palette distances to 0..1
+MAX_COLOR_DISTANCE = 255.0 * np.sqrt(3.0)
+
+
+def decode_rgb(data):
+    """
+    Decode encoded image bytes to an RGB uint8 array with OpenCV, which is
+    considerably faster than PIL for PNG. Returns None if OpenCV is not
+    available or can't decode the data, so callers can fall back to PIL.
+    """
+    if not CV2_AVAILABLE:
+        return None
+    # Ignore EXIF orientation like PIL does, so both decoders give the same pixels
+    bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION)
+    if bgr is None:
+        return None
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+
+
+def resize_nearest(img_array, size):
+    """Nearest-neighbour resize of an RGB array to size=(width, height), sampling pixel centers like PIL."""
+    h, w = img_array.shape[:2]
+    ys = ((np.arange(size[1]) + 0.5) * (h / size[1])).astype(np.intp)
+    xs = ((np.arange(size[0]) + 0.5) * (w / size[0])).astype(np.intp)
+    return img_array[ys[:, np.newaxis], xs]
+
+
+# Bit offsets of the R, G, B nibbles in extract_dominant_colors_fast's color codes
+_CODE_SHIFTS = np.array([8, 4, 0])
+
+
 def extract_dominant_colors_fast(img_array, n_colors=12):
-    """Fast extraction of dominant colors using numpy."""
-    pixels_quantized = (img_array // 16) * 16
-    pixels_flat = pixels_quantized.reshape(-1, 3)
-    
-    pixel_codes = (pixels_flat[:, 0] << 16) | (pixels_flat[:, 1] << 8) | pixels_flat[:, 2]
-    unique_codes, counts = np.unique(pixel_codes, return_counts=True)
-    
-    top_indices = np.argsort(counts)[-n_colors:][::-1]
-    top_codes = unique_codes[top_indices]
-    top_counts = counts[top_indices]
-    
-    colors = np.zeros((len(top_codes), 3), dtype=np.uint8)
-    colors[:, 0] = (top_codes >> 16) & 0xFF
-    colors[:, 1] = (top_codes >> 8) & 0xFF
-    colors[:, 2] = top_codes & 0xFF
+    """Fast extraction of dominant colors using numpy.
+    
+    Colors and weights are returned as float32 so the distance functions can
+    use them as is instead of converting on every comparison.
+    """
+    # Keep the top 4 bits per channel -> 4096 possible colors, counted with bincount
+    # Built in place (shift/OR into one uint16 buffer) to avoid per-step temporaries
+    q = img_array.reshape(-1, 3) >> 4
+    codes = q[:, 0].astype(np.uint16)
+    codes <<= 4
+    codes |= q[:, 1]
+    codes <<= 4
+    codes |= q[:, 2]
+    counts = np.bincount(codes, minlength=4096)
+    
+    n_colors = min(n_colors, np.count_nonzero(counts))
+    if n_colors == 0:
+        return np.zeros((0, 3), dtype=np.float32), np.zeros(0, dtype=np.float32)
+    
+    # Partial selection of the top N, then sort only those
+    top_codes = np.argpartition(counts, -n_colors)[-n_colors:]
+    # Most frequent first; ties broken by code so the order is deterministic
+    top_codes = top_codes[np.lexsort((top_codes, -counts[top_codes]))]
+    top_counts = counts[top_codes].astype(np.float32)
+    
+    # Decode all three channels in one broadcast shift
+    colors = (((top_codes[:, np.newaxis] >> _CODE_SHIFTS) & 0xF) << 4).astype(np.float32)
     
     weights = top_counts / top_counts.sum()
     return colors, weights
 
 
+def extract_color_histogram_counts(img_array, bins=24):
+    """Raw 3D RGB histogram counts with uniform bins over [0, 256), plus the pixel total.
+    
+    Counts are stored as uint16 (half the size of a float32 histogram) unless
+    a bin overflows it; normalize with normalize_histogram.
+    """
+    # (v * bins) >> 8 gives the same bin index as histogramdd's uniform edges,
+    # so one bincount over packed codes replaces the per-axis digitize
+    # uint16 holds both v * bins and the packed code for up to 40 bins per channel
+    q = img_array.reshape(-1, 3).astype(np.uint16 if bins ** 3 <= 65536 else np.uint32)
+    q *= bins
+    q >>= 8
+    codes = q[:, 0] * bins
+    codes += q[:, 1]
+    codes *= bins
+    codes += q[:, 2]
+    counts = np.bincount(codes, minlength=bins ** 3)
+    dtype = np.uint16 if counts.max(initial=0) <= np.iinfo(np.uint16).max else np.uint32
+    return counts.astype(dtype), int(codes.size)
+
+
+def normalize_histogram(counts, total):
+    """Normalized float32 histogram from raw counts."""
+    return counts.astype(np.float32) / (np.float32(total) + HIST_EPSILON)
+
+
+def extract_color_histogram(img_array, bins=24):
+    """Normalized 3D RGB histogram with uniform bins over [0, 256)."""
+    return normalize_histogram(*extract_color_histogram_counts(img_array, bins=bins))
+
+
+def extract_ahash_u64(img_array, hash_size=8):
+    """Average hash packed into one int, so comparisons are a single XOR + popcount.
+    
+    Block means are taken straight from the RGB array instead of converting
+    and resizing a PIL image a second time; the bit layout matches imagehash.
+    """
+    h, w = img_array.shape[:2]
+    if h < hash_size or w < hash_size:
+        # Too small for block means: upscale like imagehash does
+        small = Image.fromarray(img_array).convert('L').resize((hash_size, hash_size), Image.Resampling.LANCZOS)
+        block_means = np.asarray(small)
+    else:
+        gray = img_array @ LUMA_WEIGHTS
+        ys = np.linspace(0, h, hash_size + 1).astype(int)
+        xs = np.linspace(0, w, hash_size + 1).astype(int)
+        block_sums = np.add.reduceat(np.add.reduceat(gray, ys[:-1], axis=0), xs[:-1], axis=1)
+        block_means = block_sums / np.outer(np.diff(ys), np.diff(xs))
+    
+    # Row-major bits, first bit most significant (same layout as imagehash's hex string)
+    bits = (block_means > block_means.mean()).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hash_distance_u64(hash1, hash2):
+    """Normalized Hamming distance (0-1) between two packed 64-bit hashes."""
+    return (hash1 ^ hash2).bit_count() / 64.0
+
+
+_POPCOUNT_LUT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def hash_distance_u64_batch(hash1, hashes):
+    """Normalized Hamming distance from one packed hash to a uint64 array of hashes."""
+    xor = np.asarray(hashes, dtype=np.uint64) ^ np.uint64(hash1)
+    if hasattr(np, 'bitwise_count'):
+        bits = np.bitwise_count(xor)
+    else:
+        # NumPy < 2.0: popcount each byte through a 256-entry table
+        bits = _POPCOUNT_LUT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+    return bits / 64.0
+
+
 def extract_render_features(img_array):
     """Extract features optimized for 3D render to 2D skin matching."""
     colors, weights = extract_dominant_colors_fast(img_array, n_colors=24)
@@ -106,17 +311,15 @@ def extract_render_features(img_array):
     grid_size = 4
     cell_h, cell_w = h // grid_size, w // grid_size
     
-    spatial_features = []
-    for i in range(grid_size):
-        for j in range(grid_size):
-            cell = img_array[i*cell_h:(i+1)*cell_h, j*cell_w:(j+1)*cell_w]
-            avg_color = np.mean(cell.reshape(-1, 3), axis=0)
-            spatial_features.extend(avg_color)
+    # Crop to whole cells and average every cell in one reduction:
+    # (grid, cell_h, grid, cell_w, 3) -> (grid, grid, 3), flattened row by row
+    cells = img_array[:grid_size*cell_h, :grid_size*cell_w].reshape(grid_size, cell_h, grid_size, cell_w, 3)
+    spatial_features = cells.mean(axis=(1, 3), dtype=np.float32).ravel()
     
     return {
         'colors': colors,
         'weights': weights,
-        'spatial': np.array(spatial_features)
+        'spatial': spatial_features
     }
 
 
@@ -128,82 +331,158 @@ def is_minecraft_skin_texture(img):
     return False
 
 
+def edge_density(gray, threshold=50):
+    """Fraction of pixels whose central-difference gradient magnitude exceeds threshold."""
+    gray = np.asarray(gray, dtype=np.float32)
+    if gray.shape[0] < 3 or gray.shape[1] < 3:
+        return 0.0
+    gx = gray[1:-1, 2:] - gray[1:-1, :-2]
+    gy = gray[2:, 1:-1] - gray[:-2, 1:-1]
+    return float(np.mean(np.hypot(gx, gy) > threshold))
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _texture_pattern_kernel(img_array, threshold):
+        """Gray conversion, edge count and contrast of extract_texture_pattern in two passes."""
+        h, w = img_array.shape[0], img_array.shape[1]
+        gray = np.empty((h, w), dtype=np.int32)
+        total = 0.0
+        for y in range(h):
+            for x in range(w):
+                g = (np.int32(img_array[y, x, 0]) + img_array[y, x, 1] + img_array[y, x, 2]) // 3
+                gray[y, x] = g
+                total += g
+        mean = total / (h * w)
+        
+        # Two-pass variance like np.std; integer gradients compare exactly
+        # against threshold^2 instead of taking hypot
+        sq_dev = 0.0
+        edges = 0
+        limit = threshold * threshold
+        for y in range(h):
+            for x in range(w):
+                d = gray[y, x] - mean
+                sq_dev += d * d
+                if 0 < y < h - 1 and 0 < x < w - 1:
+                    gx = gray[y, x + 1] - gray[y, x - 1]
+                    gy = gray[y + 1, x] - gray[y - 1, x]
+                    if gx * gx + gy * gy > limit:
+                        edges += 1
+        
+        density = edges / ((h - 2) * (w - 2)) if h >= 3 and w >= 3 else 0.0
+        return density, np.sqrt(sq_dev / (h * w))
+
+
 def extract_texture_pattern(img_array):
-    """Extract texture pattern features."""
-    edges = cv2.Canny(img_array, 50, 150) if CV2_AVAILABLE else np.zeros_like(img_array[:,:,0])
-    edge_density = np.count_nonzero(edges) / edges.size
-    
-    gray = np.mean(img_array, axis=2).astype(np.uint8)
+    """
+    Texture features as a fixed-length float32 vector [edge density, contrast / 255].
+    Compare with texture_distance; equal lengths let candidates stack into one matrix.
+    """
+    if NUMBA_AVAILABLE:
+        density, contrast = _texture_pattern_kernel(img_array, 50)
+        return np.array([density, contrast / 255.0], dtype=np.float32)
+    
+    # Integer channel mean (same truncation as mean().astype(uint8)) in one
+    # uint16 reduction instead of a float64 temporary
+    gray = (img_array.sum(axis=2, dtype=np.uint16) // 3).astype(np.uint8)
     contrast = np.std(gray)
     
-    return {
-        'edge_density': edge_density,
-        'contrast': contrast
-    }
+    return np.array([edge_density(gray), contrast / 255.0], dtype=np.float32)
+
+
+def texture_distance(pattern1, pattern2):
+    """L1 distance between two texture pattern vectors (see extract_texture_pattern)."""
+    return float(np.abs(pattern1 - pattern2).sum())
 
 
 def extract_edge_features(img):
-    """Extract edge-based features from image."""
-    if not CV2_AVAILABLE:
-        return np.zeros((64, 64)), 0.0
-    
+    """Edge density of the image at 64x64."""
+    # Stays on PIL LANCZOS: its sharpening feeds the fixed edge threshold,
+    # and a smoother OpenCV resize noticeably lowers the density
     img_resized = img.resize((64, 64), Image.Resampling.LANCZOS)
-    img_array = np.array(img_resized.convert('RGB'))
-    
-    gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-    edges = cv2.Canny(gray, 50, 150)
-    edge_density = np.count_nonzero(edges) / edges.size
-    
-    return edges, edge_density
+    return edge_density(img_resized.convert('L'))
 
 
-def extract_ai_features(img):
-    """Extract features using ResNet18 neural network."""
-    if not TORCH_AVAILABLE:
+def _rgb_pixels(img):
+    """Writable (H, W, 3) uint8 array for a PIL image or an already decoded RGB array."""
+    if isinstance(img, np.ndarray):
+        # torch.from_numpy needs a writable buffer; shared read-only arrays are copied
+        return np.require(img, dtype=np.uint8, requirements=['C', 'W'])
+    return np.array(img if img.mode == 'RGB' else img.convert('RGB'))
+
+
+def _run_feature_model(model, transform, normalization, imgs):
+    """One forward pass over a list of PIL images or RGB arrays; returns an (N, D) float32 array."""
+    # Frozen TorchScript models have no parameters to ask for these
+    device, dtype = _inference_device()
+    
+    # Only the uint8 pixels are copied to the device; each (C, H, W) tensor
+    # is resized there and the whole batch is normalized at once below
+    tensors = []
+    for img in imgs:
+        pixels = torch.from_numpy(_rgb_pixels(img))
+        tensors.append(transform(pixels.permute(2, 0, 1).to(device, non_blocking=True)))
+    
+    n = len(tensors)
+    # Pad the batch to a multiple of 8 on CUDA so cuDNN can use Tensor Core kernels
+    padded = -(-n // 8) * 8 if device.type == 'cuda' else n
+    # Inputs use the same channels-last layout as the models on CUDA
+    memory_format = torch.channels_last if device.type == 'cuda' else torch.contiguous_format
+    batch = torch.empty((padded,) + tuple(tensors[0].shape), device=device, dtype=dtype, memory_format=memory_format)
+    scale, shift = normalization
+    batch[:n] = torch.addcmul(shift, torch.stack(tensors), scale)
+    batch[n:].zero_()
+    
+    # inference_mode also skips the version counter/view tracking no_grad keeps
+    with torch.inference_mode():
+        features = model(batch)
+    
+    return features[:n].flatten(1).float().cpu().numpy()
+
+
+def extract_ai_features_batch(imgs):
+    """
+    ResNet18 features for a list of images (PIL or RGB arrays) in one forward
+    pass, or None on failure.
+    """
+    if not TORCH_AVAILABLE or not imgs:
         return None
     
     try:
-        model, transform = _get_ai_model()
-        device = next(model.parameters()).device
-        
-        img_rgb = img.convert('RGB')
-        img_tensor = transform(img_rgb).unsqueeze(0).to(device)
-        
-        with torch.no_grad():
-            features = model(img_tensor)
-        
-        features = features.squeeze().cpu().numpy()
-        return features
+        return _run_feature_model(*_get_ai_model(), imgs)
     except Exception as e:
         print(f"[ERROR] AI feature extraction failed: {e}")
         return None
 
 
-def extract_mobile_features(img):
-    """Extract features using ResNet50 with optimizations."""
-    if not TORCH_AVAILABLE:
+def extract_mobile_features_batch(imgs):
+    """
+    ResNet50 features for a list of images (PIL or RGB arrays) in one forward
+    pass, or None on failure.
+    """
+    if not TORCH_AVAILABLE or not imgs:
         return None
     
     try:
-        model, transform = _get_mobile_model()
-        device = next(model.parameters()).device
-        
-        img_rgb = img.convert('RGB')
-        img_tensor = transform(img_rgb).unsqueeze(0).to(device)
-        
-        if device.type == 'cuda':
-            img_tensor = img_tensor.half()
-        
-        with torch.no_grad():
-            features = model(img_tensor)
-        
-        features = features.squeeze().cpu().float().numpy()
-        return features
+        return _run_feature_model(*_get_mobile_model(), imgs)
     except Exception as e:
         print(f"[ERROR] Mobile feature extraction failed: {e}")
         return None
 
 
+def extract_ai_features(img):
+    """Extract features using ResNet18 neural network."""
+    features = extract_ai_features_batch([img])
+    return None if features is None else features[0]
+
+
+def extract_mobile_features(img):
+    """Extract features using ResNet50 with optimizations."""
+    features = extract_mobile_features_batch([img])
+    return None if features is None else features[0]
+
+
 def convert_render_to_skin(render_img):
     """Convert a 3D render to a 2D skin using pixel extraction."""
     if isinstance(render_img, np.ndarray):
@@ -315,38 +594,288 @@ def extract_visible_skin_regions(skin_array):
     return np.concatenate([region.flatten() for region in visible_pixels])
 
 
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _palette_distance_kernel(c1, w1, c2):
+        """Weighted nearest-color distance sum using a running minimum per row."""
+        total = 0.0
+        for i in range(c1.shape[0]):
+            best = -1.0
+            for j in range(c2.shape[0]):
+                d0 = c1[i, 0] - c2[j, 0]
+                d1 = c1[i, 1] - c2[j, 1]
+                d2 = c1[i, 2] - c2[j, 2]
+                d = d0 * d0 + d1 * d1 + d2 * d2
+                if best < 0.0 or d < best:
+                    best = d
+            # sqrt only once per row, on the minimum
+            total += np.sqrt(best) * w1[i]
+        return total
+
+
+def _scaled_palette_weights(weights):
+    """Palette weights with the 0..1 distance normalization folded in."""
+    return np.asarray(weights, dtype=np.float32) * np.float32(1.0 / MAX_COLOR_DISTANCE)
+
+
 def color_palette_distance_fast(colors1, weights1, colors2, weights2):
     """Calculate distance between two color palettes."""
-    total_distance = 0
-    for i, (c1, w1) in enumerate(zip(colors1, weights1)):
-        min_dist = float('inf')
-        for c2 in colors2:
-            dist = np.linalg.norm(c1.astype(float) - c2.astype(float))
-            min_dist = min(min_dist, dist)
-        total_distance += w1 * min_dist
-    return total_distance / (255.0 * np.sqrt(3))
-
-
-def calculate_ssim_distance(img1, img2):
-    """Calculate SSIM distance between two images."""
-    if not SSIM_AVAILABLE:
+    if len(colors1) == 0 or len(colors2) == 0:
         return 1.0
     
+    # No-op conversions for features from extract_dominant_colors_fast
+    c1 = np.asarray(colors1, dtype=np.float32)
+    c2 = np.asarray(colors2, dtype=np.float32)
+    w1 = _scaled_palette_weights(weights1)
+    
+    if NUMBA_AVAILABLE:
+        total_distance = _palette_distance_kernel(c1, w1, c2)
+    else:
+        # |a-b|^2 = |a|^2 + |b|^2 - 2a.b: one (n1, n2) matmul instead of an
+        # (n1, n2, 3) difference tensor, and sqrt only on the n1 row minimums
+        d2 = c1 @ c2.T
+        d2 *= -2
+        d2 += np.einsum('ij,ij->i', c1, c1)[:, np.newaxis]
+        d2 += np.einsum('ij,ij->i', c2, c2)
+        min_distances = np.sqrt(np.maximum(d2.min(axis=1), 0))
+        total_distance = min_distances @ w1
+    
+    return min(total_distance, 1.0)
+
+
+def stack_palettes(colors_list, n_colors=12):
+    """Pad a list of palettes into a (M, n_colors, 3) array plus a validity mask."""
+    lengths = np.array([min(len(palette), n_colors) for palette in colors_list], dtype=np.intp)
+    # Each palette fills a prefix of its row, so the mask places all of them
+    # with one scatter instead of a slice assignment per palette
+    valid = np.arange(n_colors) < lengths[:, np.newaxis]
+    colors = np.zeros((len(colors_list), n_colors, 3), dtype=np.float32)
+    if lengths.any():
+        colors[valid] = np.concatenate([np.reshape(palette[:n], (-1, 3))
+                                        for palette, n in zip(colors_list, lengths) if n])
+    return colors, valid
+
+
+def palette_sq_norms(colors_bank):
+    """Squared norm of every color in a (M, n, 3) palette stack."""
+    return np.einsum('mkj,mkj->mk', colors_bank, colors_bank)
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True, parallel=True)
+    def _palette_distance_batch_kernel(c1, w1, colors_bank, valid_bank):
+        """_palette_distance_kernel for every bank row, candidates spread over threads."""
+        m = colors_bank.shape[0]
+        out = np.empty(m)
+        for k in prange(m):
+            total = 0.0
+            any_valid = False
+            for i in range(c1.shape[0]):
+                best = -1.0
+                for j in range(colors_bank.shape[1]):
+                    if not valid_bank[k, j]:
+                        continue
+                    d0 = c1[i, 0] - colors_bank[k, j, 0]
+                    d1 = c1[i, 1] - colors_bank[k, j, 1]
+                    d2 = c1[i, 2] - colors_bank[k, j, 2]
+                    d = d0 * d0 + d1 * d1 + d2 * d2
+                    if best < 0.0 or d < best:
+                        best = d
+                if best >= 0.0:
+                    any_valid = True
+                    total += np.sqrt(best) * w1[i]
+            out[k] = total if any_valid else 1.0
+        return out
+
+
+def color_palette_distance_batch(colors1, weights1, colors_bank, valid_bank, bank_sq_norms=None):
+    """
+    Palette distance from one palette to M stacked palettes (see stack_palettes).
+    bank_sq_norms optionally passes the precomputed (M, n) squared color norms.
+    """
+    if len(colors1) == 0:
+        return np.ones(len(colors_bank))
+    
+    c1 = np.asarray(colors1, dtype=np.float32)
+    w1 = _scaled_palette_weights(weights1)
+    if NUMBA_AVAILABLE:
+        distances = _palette_distance_batch_kernel(c1, w1, colors_bank, valid_bank)
+        return np.minimum(distances, 1.0, out=distances)
+    
+    # (M, n1, n2) squared distances via |a|^2 + |b|^2 - 2a.b (no (M, n1, n2, 3)
+    # temporary); padded slots can never be the nearest color
+    if bank_sq_norms is None:
+        bank_sq_norms = palette_sq_norms(colors_bank)
+    d2 = np.einsum('ij,mkj->mik', c1, colors_bank, optimize=True)
+    d2 *= -2
+    d2 += np.einsum('ij,ij->i', c1, c1)[np.newaxis, :, np.newaxis]
+    d2 += bank_sq_norms[:, np.newaxis, :]
+    d2 = np.where(valid_bank[:, np.newaxis, :], d2, np.inf)
+    min_distances = np.sqrt(np.maximum(d2.min(axis=2), 0))
+    
+    distances = min_distances @ w1
+    distances[~valid_bank.any(axis=1)] = 1.0
+    return np.minimum(distances, 1.0, out=distances)
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _chi_square_kernel(h1, h2):
+        """Single fused pass over both histograms (no diff/square temporaries)."""
+        total = 0.0
+        for i in range(h1.shape[0]):
+            d = h1[i] - h2[i]
+            total += d * d / (h1[i] + h2[i] + 1e-10)
+        return 0.5 * total
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True)
+    def _chi_square_counts_kernel(c1, total1, c2, total2):
+        """Chi-squared on raw counts, normalizing each bin on the fly."""
+        s1 = 1.0 / (total1 + 1e-10)
+        s2 = 1.0 / (total2 + 1e-10)
+        total = 0.0
+        for i in range(c1.shape[0]):
+            p = c1[i] * s1
+            q = c2[i] * s2
+            d = p - q
+            total += d * d / (p + q + 1e-10)
+        return 0.5 * total
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True, fastmath=True, parallel=True)
+    def _chi_square_batch_kernel(target_hist, hist_matrix):
+        """_chi_square_kernel for every matrix row, candidates spread over threads."""
+        m = hist_matrix.shape[0]
+        out = np.empty(m)
+        for k in prange(m):
+            total = 0.0
+            for i in range(target_hist.shape[0]):
+                p = hist_matrix[k, i]
+                q = target_hist[i]
+                d = p - q
+                total += d * d / (p + q + 1e-10)
+            out[k] = 0.5 * total
+        return out
+
+
+def chi_square_distance(hist1, hist2):
+    """Chi-squared distance between two normalized histograms."""
+    if NUMBA_AVAILABLE:
+        return _chi_square_kernel(hist1, hist2)
+    return np.sum((hist1 - hist2) ** 2 / (hist1 + hist2 + HIST_EPSILON)) / 2
+
+
+def chi_square_distance_counts(counts1, total1, counts2, total2):
+    """Chi-squared distance between two raw count histograms (see extract_color_histogram_counts)."""
+    if NUMBA_AVAILABLE:
+        return _chi_square_counts_kernel(counts1, float(total1), counts2, float(total2))
+    return chi_square_distance(normalize_histogram(counts1, total1), normalize_histogram(counts2, total2))
+
+
+def histogram_distance(features1, features2):
+    """Chi-squared distance between the 'hist_counts'/'hist_total' features of two images."""
+    return chi_square_distance_counts(features1['hist_counts'], features1['hist_total'],
+                                      features2['hist_counts'], features2['hist_total'])
+
+
+def chi_square_distance_batch(target_hist, hist_matrix):
+    """Chi-squared distance from one histogram to each row of a (M, bins) matrix."""
+    if NUMBA_AVAILABLE:
+        return _chi_square_batch_kernel(target_hist, hist_matrix)
+    # Two (M, bins) buffers updated in place instead of one temporary per operator
+    num = hist_matrix - target_hist
+    num *= num
+    den = hist_matrix + target_hist
+    den += HIST_EPSILON
+    num /= den
+    return 0.5 * num.sum(axis=1)
+
+
+def hellinger_distance_batch(sqrt_target_hist, sqrt_hist_matrix):
+    """
+    Squared Hellinger distance 1 - sum(sqrt(p) * sqrt(q)) from one histogram to
+    each row, given element-wise square roots of normalized histograms.
+    A single matrix-vector product; bounds the chi-squared distance as
+    hellinger <= chi_square <= 2 * hellinger.
+    """
+    return np.maximum(1.0 - sqrt_hist_matrix @ sqrt_target_hist, 0.0)
+
+
+def chi_square_distance_batch_gpu(target_hist, hist_matrix_gpu):
+    """chi_square_distance_batch against a CuPy-resident matrix; returns a numpy array."""
+    target_gpu = cp.asarray(target_hist)
+    scores = 0.5 * ((hist_matrix_gpu - target_gpu) ** 2 / (hist_matrix_gpu + target_gpu + HIST_EPSILON)).sum(axis=1)
+    return cp.asnumpy(scores)
+
+
+def _window_means(x, win_size):
+    """Mean of every win_size x win_size window fully inside x, via an integral image."""
+    integral = np.zeros((x.shape[0] + 1, x.shape[1] + 1))
+    integral[1:, 1:] = x.cumsum(axis=0).cumsum(axis=1)
+    window_sums = (integral[win_size:, win_size:] - integral[:-win_size, win_size:]
+                   - integral[win_size:, :-win_size] + integral[:-win_size, :-win_size])
+    return window_sums / (win_size * win_size)
+
+
+def ssim_index(gray1, gray2, win_size=7, data_range=255.0):
+    """
+    Mean SSIM of two equally sized grayscale arrays.
+    Same definition as scikit-image's structural_similarity defaults (7x7
+    uniform window, sample covariance, mean over valid windows), but each
+    window statistic costs four integral-image lookups.
+    """
+    x = np.asarray(gray1, dtype=np.float64)
+    y = np.asarray(gray2, dtype=np.float64)
+    
+    ux = _window_means(x, win_size)
+    uy = _window_means(y, win_size)
+    uxx = _window_means(x * x, win_size)
+    uyy = _window_means(y * y, win_size)
+    uxy = _window_means(x * y, win_size)
+    
+    n = win_size * win_size
+    cov_norm = n / (n - 1)
+    vx = cov_norm * (uxx - ux * ux)
+    vy = cov_norm * (uyy - uy * uy)
+    vxy = cov_norm * (uxy - ux * uy)
+    
+    c1 = (0.01 * data_range) ** 2
+    c2 = (0.03 * data_range) ** 2
+    ssim_map = ((2 * ux * uy + c1) * (2 * vxy + c2)) / ((ux * ux + uy * uy + c1) * (vx + vy + c2))
+    return float(ssim_map.mean())
+
+
+def extract_ssim_gray(img, size=64):
+    """
+    Small grayscale array that calculate_ssim_distance compares. Computed
+    once per image, with OpenCV (INTER_AREA when shrinking) when available.
+    """
+    if not CV2_AVAILABLE:
+        return np.asarray(img.resize((size, size), Image.Resampling.BILINEAR).convert('L'))
+    
+    gray = cv2.cvtColor(np.asarray(img if img.mode == 'RGB' else img.convert('RGB')), cv2.COLOR_RGB2GRAY)
+    if gray.shape == (size, size):
+        return gray
+    shrinking = gray.shape[0] > size and gray.shape[1] > size
+    return cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_LINEAR)
+
+
+def calculate_ssim_distance(gray1, gray2):
+    """Calculate SSIM distance between two extract_ssim_gray arrays."""
     try:
-        img1_resized = img1.resize((64, 64), Image.Resampling.LANCZOS)
-        img2_resized = img2.resize((64, 64), Image.Resampling.LANCZOS)
-        
-        img1_gray = np.array(img1_resized.convert('L'))
-        img2_gray = np.array(img2_resized.convert('L'))
-        
-        similarity = ssim(img1_gray, img2_gray)
-        return 1.0 - similarity
+        return 1.0 - ssim_index(gray1, gray2)
     except:
         return 1.0
 
 
 def calculate_ai_similarity(features1, features2):
     """Calculate cosine similarity between AI feature vectors."""
+    # Stored features are float16; sums of squares could overflow in it
+    features1 = np.asarray(features1, dtype=np.float32)
+    features2 = np.asarray(features2, dtype=np.float32)
     norm1 = np.linalg.norm(features1)
     norm2 = np.linalg.norm(features2)
     
@@ -356,3 +885,29 @@ def calculate_ai_similarity(features1, features2):
     cosine_sim = np.dot(features1, features2) / (norm1 * norm2)
     distance = (1.0 - cosine_sim) / 2.0
     return max(0.0, min(1.0, distance))
+
+
+def normalize_feature_rows(feature_matrix):
+    """
+    (N, D) AI feature vectors scaled to unit length, as contiguous float32.
+    All-zero rows become NaN so compute_ai_distances can score them as 1.0.
+    """
+    matrix = np.array(feature_matrix, dtype=np.float32, order='C')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        matrix /= np.linalg.norm(matrix, axis=1)[:, np.newaxis]
+    return matrix
+
+
+def compute_ai_distances(target_features, candidate_matrix):
+    """
+    calculate_ai_similarity from one feature vector to every row of a
+    normalize_feature_rows matrix, as a single matrix-vector product.
+    """
+    target = np.asarray(target_features, dtype=np.float32)
+    norm = np.linalg.norm(target)
+    if norm == 0:
+        return np.ones(len(candidate_matrix))
+    
+    distances = (1.0 - candidate_matrix @ (target / norm)) * 0.5
+    distances[np.isnan(distances)] = 1.0
+    return np.clip(distances, 0.0, 1.0, out=distances)
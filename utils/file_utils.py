@@ -50,21 +50,33 @@ def copy_and_rename_to_png(input_dir, output_dir=None, merge_files=False, log_ca
     file_count = 0
     file_name_counter = {}  # Track duplicate filenames when merging
     
+    # Work on plain strings inside the loop; Path objects are only used at the
+    # API boundary above since building them per file is pure overhead
+    input_str = str(input_path)
+    output_str = str(output_path)
+    input_len = len(input_str)
+    sep = os.sep
+    copy_file = shutil.copy2
+    
     # Walk through the input directory
-    for root, dirs, files in os.walk(input_path):
+    for root, dirs, files in os.walk(input_str):
         # Check for cancellation
         if cancel_check and cancel_check():
             return False
         
         if merge_files:
             # Merge mode: all files go to root output directory
-            current_output_dir = output_path
+            dst_dir_str = output_str
         else:
             # Normal mode: preserve directory structure
-            rel_path = Path(root).relative_to(input_path)
-            current_output_dir = output_path / rel_path
+            rel_str = root[input_len:].lstrip(sep)
+            dst_dir_str = os.path.join(output_str, rel_str) if rel_str else output_str
             # Create subdirectories in output
-            current_output_dir.mkdir(parents=True, exist_ok=True)
+            os.makedirs(dst_dir_str, exist_ok=True)
+        
+        # Per-directory prefixes so each file only needs a string concat
+        src_prefix = root if root.endswith(sep) else root + sep
+        dst_prefix = dst_dir_str if dst_dir_str.endswith(sep) else dst_dir_str + sep
         
         # Copy and rename files
         for file in files:
@@ -72,23 +84,22 @@ def copy_and_rename_to_png(input_dir, output_dir=None, merge_files=False, log_ca
             if cancel_check and cancel_check():
                 return False
             
-            src_file = Path(root) / file
+            src_file = src_prefix + file
             
             if merge_files:
                 # Handle potential duplicate filenames
-                base_name = file
-                if base_name in file_name_counter:
-                    file_name_counter[base_name] += 1
+                if file in file_name_counter:
+                    file_name_counter[file] += 1
                     # Add counter before .png extension
-                    dst_file = current_output_dir / f"{base_name}_{file_name_counter[base_name]}.png"
+                    dst_file = f"{dst_prefix}{file}_{file_name_counter[file]}.png"
                 else:
-                    file_name_counter[base_name] = 0
-                    dst_file = current_output_dir / (base_name + '.png')
+                    file_name_counter[file] = 0
+                    dst_file = dst_prefix + file + '.png'
             else:
-                dst_file = current_output_dir / (file + '.png')
+                dst_file = dst_prefix + file + '.png'
             
             try:
-                shutil.copy2(src_file, dst_file)
+                copy_file(src_file, dst_file)
                 file_count += 1
                 if file_count % 10 == 0:  # Log every 10 files to avoid spam
                     log(f"Copied {file_count} files...")
@@ -0,0 +1,536 @@
+"""
+Legacy matching implementations for algorithms that have not been migrated
+to the algorithms package yet. utils.image_matcher delegates here when
+get_algorithm() has no class for the requested algorithm.
+"""
+
+import numpy as np
+
+from utils import feature_extractors
+from utils.feature_bank import FeatureBank, batch_results
+from utils.feature_extractors import TORCH_AVAILABLE
+
+# Weight configuration per algorithm
+ALGORITHM_WEIGHTS = {
+    "balanced": {"dominant_colors": 0.60, "color_histogram": 0.35, "perceptual_hash": 0.05},
+    "skin_optimized": {"texture_pattern": 0.40, "dominant_colors": 0.35, "dimension_match": 0.15, "color_histogram": 0.10},
+    "deep_features": {"edge_similarity": 0.50, "ssim": 0.30, "dominant_colors": 0.20},
+    "color_distribution": {"color_histogram": 0.70, "dominant_colors": 0.30},
+    "fast": {"color_histogram": 0.80, "perceptual_hash": 0.20},
+    "ai_perceptual": {"deep_features": 0.50, "dominant_colors": 0.35, "color_histogram": 0.15},
+    "ai_mobile": {"mobile_features": 0.75, "dominant_colors": 0.15, "color_histogram": 0.07, "perceptual_hash": 0.03},
+    "render_match": {"color_palette": 0.70, "spatial_pattern": 0.30},
+    "render_to_skin": {"visible_regions": 1.0}
+}
+
+
+def extract_features(image_path, img, img_array, algorithm, model_input=None, with_model=True):
+    """
+    Feature extraction for algorithms not yet migrated to the algorithms package.
+    model_input is the already decoded full-size RGB array for the network
+    features; without it the networks read the PIL image. With
+    with_model=False the network features are left out, to be added for many
+    images at once with add_model_features.
+    """
+    if model_input is None:
+        model_input = img
+    
+    features = {
+        'algorithm': algorithm,
+        'path': image_path
+    }
+    
+    # Common features; each is only extracted for the algorithms that score it
+    if algorithm in ["fast", "ai_perceptual", "ai_mobile"]:
+        features['ahash_u64'] = feature_extractors.extract_ahash_u64(img_array, hash_size=8)
+    
+    if algorithm in ["skin_optimized", "color_distribution", "deep_features", "ai_perceptual", "ai_mobile"]:
+        dominant_colors, color_weights = feature_extractors.extract_dominant_colors_fast(img_array, n_colors=12)
+        features['dominant_colors'] = dominant_colors
+        features['color_weights'] = color_weights
+    
+    if algorithm in ["color_distribution", "fast", "ai_perceptual", "ai_mobile"]:
+        bins = 16 if algorithm == "fast" else 24
+        features['hist_counts'], features['hist_total'] = feature_extractors.extract_color_histogram_counts(img_array, bins=bins)
+    
+    if algorithm == "skin_optimized":
+        features['is_skin_texture'] = feature_extractors.is_minecraft_skin_texture(img)
+        features['texture_pattern'] = feature_extractors.extract_texture_pattern(img_array)
+        # An array rather than a tuple so the features stay cacheable
+        features['dimensions'] = np.array(img.size, dtype=np.int32)
+    
+    if algorithm == "deep_features":
+        features['edge_density'] = feature_extractors.extract_edge_features(img)
+        features['ssim_gray'] = feature_extractors.extract_ssim_gray(img)
+    
+    if with_model:
+        add_model_features([features], [model_input], algorithm)
+    
+    return features, None
+
+
+def add_model_features(features_list, model_inputs, algorithm):
+    """
+    Add the network features of an AI algorithm to each feature dict, running
+    the network once over all of model_inputs (PIL images or RGB arrays).
+    """
+    if algorithm == "ai_perceptual":
+        key, extract_batch = 'ai', feature_extractors.extract_ai_features_batch
+    elif algorithm == "ai_mobile":
+        key, extract_batch = 'mobile', feature_extractors.extract_mobile_features_batch
+    else:
+        return
+    
+    rows = extract_batch(model_inputs) if TORCH_AVAILABLE else None
+    if rows is not None:
+        # Kept (and cached) as float16: half the memory and disk of float32,
+        # for cosine distances off by ~1e-5. Scoring upcasts to float32.
+        rows = rows.astype(np.float16)
+    for i, features in enumerate(features_list):
+        if TORCH_AVAILABLE:
+            features[f'{key}_features'] = None if rows is None else rows[i]
+        features[f'{key}_available'] = rows is not None
+
+
+def _rejected(metrics):
+    """Result for a candidate whose partial distance already exceeds the threshold."""
+    metrics['early_exit'] = True
+    metrics['combined'] = float('inf')
+    return float('inf'), metrics
+
+
+def _score_skin_optimized(target_features, candidate_features, weights, threshold):
+    """Texture, palette and skin-layout distance, histograms last."""
+    texture_distance = feature_extractors.texture_distance(
+        target_features['texture_pattern'],
+        candidate_features['texture_pattern']
+    )
+    
+    color_distance = feature_extractors.color_palette_distance_fast(
+        target_features['dominant_colors'],
+        target_features['color_weights'],
+        candidate_features['dominant_colors'],
+        candidate_features['color_weights']
+    )
+    
+    is_target_skin = target_features.get('is_skin_texture', False)
+    is_candidate_skin = candidate_features.get('is_skin_texture', False)
+    dimension_distance = 0.0 if (is_target_skin and is_candidate_skin) else 0.5
+    
+    partial_distance = (
+        weights['texture_pattern'] * texture_distance +
+        weights['dominant_colors'] * color_distance +
+        weights['dimension_match'] * dimension_distance
+    )
+    if threshold is not None and partial_distance > threshold:
+        return _rejected({'texture_dist': texture_distance, 'color_dist': color_distance,
+                          'dim_dist': dimension_distance})
+    
+    if 'hist_counts' in target_features and 'hist_counts' in candidate_features:
+        hist_distance = feature_extractors.histogram_distance(target_features, candidate_features)
+    else:
+        hist_distance = 0.0
+    
+    combined_distance = (
+        weights['texture_pattern'] * texture_distance +
+        weights['dominant_colors'] * color_distance +
+        weights['dimension_match'] * dimension_distance +
+        weights.get('color_histogram', 0.1) * hist_distance
+    )
+    
+    metrics = {
+        'texture_dist': texture_distance,
+        'color_dist': color_distance,
+        'dim_dist': dimension_distance,
+        'hist_dist': hist_distance,
+        'combined': combined_distance
+    }
+    
+    return combined_distance, metrics
+
+
+def _score_deep_features(target_features, candidate_features, weights, threshold):
+    """Edge density and palette distance, then SSIM."""
+    edge_distance = abs(target_features['edge_density'] - candidate_features['edge_density'])
+    
+    color_distance = feature_extractors.color_palette_distance_fast(
+        target_features['dominant_colors'],
+        target_features['color_weights'],
+        candidate_features['dominant_colors'],
+        candidate_features['color_weights']
+    )
+    
+    # SSIM is by far the most expensive metric, so it runs last
+    partial_distance = weights['edge_similarity'] * edge_distance + weights['dominant_colors'] * color_distance
+    if threshold is not None and partial_distance > threshold:
+        return _rejected({'edge_dist': edge_distance, 'color_dist': color_distance})
+    
+    ssim_distance = feature_extractors.calculate_ssim_distance(
+        target_features['ssim_gray'],
+        candidate_features['ssim_gray']
+    )
+    
+    combined_distance = (
+        weights['edge_similarity'] * edge_distance +
+        weights['ssim'] * ssim_distance +
+        weights['dominant_colors'] * color_distance
+    )
+    
+    metrics = {
+        'edge_dist': edge_distance,
+        'ssim_dist': ssim_distance,
+        'color_dist': color_distance,
+        'combined': combined_distance
+    }
+    
+    return combined_distance, metrics
+
+
+def _score_color_distribution(target_features, candidate_features, weights, threshold):
+    """Palette distance, then histogram distance."""
+    color_distance = feature_extractors.color_palette_distance_fast(
+        target_features['dominant_colors'],
+        target_features['color_weights'],
+        candidate_features['dominant_colors'],
+        candidate_features['color_weights']
+    )
+    if threshold is not None and weights['dominant_colors'] * color_distance > threshold:
+        return _rejected({'color_dist': color_distance})
+    
+    hist_distance = feature_extractors.histogram_distance(target_features, candidate_features)
+    
+    combined_distance = (
+        weights['color_histogram'] * hist_distance +
+        weights['dominant_colors'] * color_distance
+    )
+    
+    metrics = {
+        'hist_dist': hist_distance,
+        'color_dist': color_distance,
+        'combined': combined_distance
+    }
+    
+    return combined_distance, metrics
+
+
+def _score_fast(target_features, candidate_features, weights, threshold):
+    """Perceptual hash, then histogram distance."""
+    hash_distance = feature_extractors.hash_distance_u64(target_features['ahash_u64'], candidate_features['ahash_u64'])
+    if threshold is not None and weights['perceptual_hash'] * hash_distance > threshold:
+        return _rejected({'hash_dist': hash_distance * 64})
+    
+    hist_distance = feature_extractors.histogram_distance(target_features, candidate_features)
+    
+    combined_distance = (
+        weights['color_histogram'] * hist_distance +
+        weights['perceptual_hash'] * hash_distance
+    )
+    
+    metrics = {
+        'hist_dist': hist_distance,
+        'hash_dist': hash_distance * 64,
+        'combined': combined_distance
+    }
+    
+    return combined_distance, metrics
+
+
+def _score_ai_perceptual(target_features, candidate_features, weights, threshold):
+    """ResNet feature distance, falling back to colors without PyTorch."""
+    if target_features.get('ai_available') and candidate_features.get('ai_available'):
+        # Palette first: a candidate it already rules out skips the feature dot product
+        color_distance = feature_extractors.color_palette_distance_fast(
+            target_features['dominant_colors'],
+            target_features['color_weights'],
+            candidate_features['dominant_colors'],
+            candidate_features['color_weights']
+        )
+        if threshold is not None and weights['dominant_colors'] * color_distance > threshold:
+            return _rejected({'color_dist': color_distance})
+        
+        ai_distance = feature_extractors.calculate_ai_similarity(
+            target_features['ai_features'],
+            candidate_features['ai_features']
+        )
+        
+        partial_distance = weights['deep_features'] * ai_distance + weights['dominant_colors'] * color_distance
+        if threshold is not None and partial_distance > threshold:
+            return _rejected({'ai_dist': ai_distance, 'color_dist': color_distance})
+        
+        hist_distance = feature_extractors.histogram_distance(target_features, candidate_features)
+        
+        combined_distance = (
+            weights['deep_features'] * ai_distance +
+            weights['dominant_colors'] * color_distance +
+            weights['color_histogram'] * hist_distance
+        )
+        
+        metrics = {
+            'ai_dist': ai_distance,
+            'color_dist': color_distance,
+            'hist_dist': hist_distance,
+            'combined': combined_distance
+        }
+    else:
+        # Fallback
+        hash_distance = 0.5
+        color_distance = feature_extractors.color_palette_distance_fast(
+            target_features['dominant_colors'],
+            target_features['color_weights'],
+            candidate_features['dominant_colors'],
+            candidate_features['color_weights']
+        )
+        hist_distance = feature_extractors.histogram_distance(target_features, candidate_features)
+        
+        combined_distance = 0.6 * color_distance + 0.4 * hist_distance
+        metrics = {
+            'color_dist': color_distance,
+            'hist_dist': hist_distance,
+            'ai_unavailable': True,
+            'combined': combined_distance
+        }
+    
+    return combined_distance, metrics
+
+
+def _score_ai_mobile(target_features, candidate_features, weights, threshold):
+    """Mobile network feature distance, falling back to colors without PyTorch."""
+    if target_features.get('mobile_available') and candidate_features.get('mobile_available'):
+        # Hash and palette first: a candidate they already rule out skips the
+        # 2048-D feature dot product
+        hash_distance = feature_extractors.hash_distance_u64(target_features['ahash_u64'], candidate_features['ahash_u64'])
+        
+        color_distance = feature_extractors.color_palette_distance_fast(
+            target_features['dominant_colors'],
+            target_features['color_weights'],
+            candidate_features['dominant_colors'],
+            candidate_features['color_weights']
+        )
+        
+        cheap_distance = weights['dominant_colors'] * color_distance + weights['perceptual_hash'] * hash_distance
+        if threshold is not None and cheap_distance > threshold:
+            return _rejected({'color_dist': color_distance, 'hash_dist': hash_distance * 64})
+        
+        mobile_distance = feature_extractors.calculate_ai_similarity(
+            target_features['mobile_features'],
+            candidate_features['mobile_features']
+        )
+        
+        partial_distance = (
+            weights['mobile_features'] * mobile_distance +
+            weights['dominant_colors'] * color_distance +
+            weights['perceptual_hash'] * hash_distance
+        )
+        if threshold is not None and partial_distance > threshold:
+            return _rejected({'mobile_dist': mobile_distance, 'color_dist': color_distance,
+                              'hash_dist': hash_distance * 64})
+        
+        hist_distance = feature_extractors.histogram_distance(target_features, candidate_features)
+        
+        combined_distance = (
+            weights['mobile_features'] * mobile_distance +
+            weights['dominant_colors'] * color_distance +
+            weights['color_histogram'] * hist_distance +
+            weights['perceptual_hash'] * hash_distance
+        )
+        
+        metrics = {
+            'mobile_dist': mobile_distance,
+            'color_dist': color_distance,
+            'hist_dist': hist_distance,
+            'hash_dist': hash_distance * 64,
+            'combined': combined_distance
+        }
+    else:
+        # Fallback
+        color_distance = feature_extractors.color_palette_distance_fast(
+            target_features['dominant_colors'],
+            target_features['color_weights'],
+            candidate_features['dominant_colors'],
+            candidate_features['color_weights']
+        )
+        hist_distance = feature_extractors.histogram_distance(target_features, candidate_features)
+        
+        combined_distance = 0.6 * color_distance + 0.4 * hist_distance
+        metrics = {
+            'color_dist': color_distance,
+            'hist_dist': hist_distance,
+            'mobile_unavailable': True,
+            'combined': combined_distance
+        }
+    
+    return combined_distance, metrics
+
+
+# Per-algorithm scorers, looked up once per call instead of an if/elif chain
+_SCORERS = {
+    "skin_optimized": _score_skin_optimized,
+    "deep_features": _score_deep_features,
+    "color_distribution": _score_color_distribution,
+    "fast": _score_fast,
+    "ai_perceptual": _score_ai_perceptual,
+    "ai_mobile": _score_ai_mobile,
+}
+
+
+def calculate_similarity(target_features, candidate_features, algorithm, threshold=None):
+    """Legacy similarity calculation for algorithms not yet migrated."""
+    scorer = _SCORERS.get(algorithm)
+    if scorer is None:
+        return 0.0, {}
+    return scorer(target_features, candidate_features, ALGORITHM_WEIGHTS[algorithm], threshold)
+
+
+def _batch_terms(target_features, candidates_list, algorithm, use_gpu):
+    """
+    (combined distances, {metric: array}) for the algorithms in _BATCH_SCORERS,
+    or None when they can't be vectorized for these features.
+    """
+    batch_scorer = _BATCH_SCORERS.get(algorithm)
+    if not len(candidates_list) or batch_scorer is None:
+        return None
+    bank = FeatureBank.from_features(candidates_list)
+    return batch_scorer(target_features, bank, ALGORITHM_WEIGHTS[algorithm], use_gpu)
+
+
+def calculate_similarity_batch(target_features, candidates_list, algorithm, use_gpu=False):
+    """Legacy batch similarity; vectorizes the algorithms built only from array features."""
+    terms = _batch_terms(target_features, candidates_list, algorithm, use_gpu)
+    if terms is None:
+        return [calculate_similarity(target_features, candidate, algorithm)
+                for candidate in candidates_list]
+    return batch_results(*terms)
+
+
+def calculate_distances_batch(target_features, candidates_list, algorithm, use_gpu=False):
+    """Combined distance to every candidate as an (N,) array, without per-candidate metrics."""
+    terms = _batch_terms(target_features, candidates_list, algorithm, use_gpu)
+    if terms is None:
+        return np.array([calculate_similarity(target_features, candidate, algorithm)[0]
+                         for candidate in candidates_list], dtype=np.float64)
+    return terms[0]
+
+
+def _target_histogram(target_features):
+    """Normalized histogram of the target, compared against the bank's rows."""
+    return feature_extractors.normalize_histogram(target_features['hist_counts'], target_features['hist_total'])
+
+
+def _color_distribution_batch(target_features, bank, weights, use_gpu):
+    """color_distribution for a whole FeatureBank."""
+    hist_distances = bank.histogram_distances(_target_histogram(target_features), use_gpu=use_gpu)
+    color_distances = bank.palette_distances(
+        target_features['dominant_colors'],
+        target_features['color_weights']
+    )
+    
+    combined_distances = (
+        weights['color_histogram'] * hist_distances +
+        weights['dominant_colors'] * color_distances
+    )
+    return combined_distances, {
+        'hist_dist': hist_distances,
+        'color_dist': color_distances
+    }
+
+
+def _fast_batch(target_features, bank, weights, use_gpu):
+    """fast for a whole FeatureBank."""
+    hist_distances = bank.histogram_distances(_target_histogram(target_features), use_gpu=use_gpu)
+    hash_distances = feature_extractors.hash_distance_u64_batch(target_features['ahash_u64'], bank.ahashes)
+    
+    combined_distances = (
+        weights['color_histogram'] * hist_distances +
+        weights['perceptual_hash'] * hash_distances
+    )
+    return combined_distances, {
+        'hist_dist': hist_distances,
+        'hash_dist': hash_distances * 64
+    }
+
+
+def _skin_optimized_batch(target_features, bank, weights, use_gpu):
+    """skin_optimized for a whole FeatureBank (no histograms are extracted for it)."""
+    texture_distances = np.abs(bank.texture_patterns - target_features['texture_pattern']).sum(axis=1)
+    color_distances = bank.palette_distances(
+        target_features['dominant_colors'],
+        target_features['color_weights']
+    )
+    if target_features.get('is_skin_texture', False):
+        both_skins = np.array([c.get('is_skin_texture', False) for c in bank], dtype=bool)
+        dimension_distances = np.where(both_skins, 0.0, 0.5)
+    else:
+        dimension_distances = np.full(len(bank), 0.5)
+    
+    combined_distances = (
+        weights['texture_pattern'] * texture_distances +
+        weights['dominant_colors'] * color_distances +
+        weights['dimension_match'] * dimension_distances
+    )
+    return combined_distances, {
+        'texture_dist': texture_distances,
+        'color_dist': color_distances,
+        'dim_dist': dimension_distances,
+        'hist_dist': 0.0
+    }
+
+
+def _ai_perceptual_batch(target_features, bank, weights, use_gpu):
+    """ai_perceptual for a whole FeatureBank; needs ResNet features for every image."""
+    if not target_features.get('ai_available') or bank.ai_features is None:
+        return None
+    
+    ai_distances = feature_extractors.compute_ai_distances(target_features['ai_features'], bank.ai_features)
+    color_distances = bank.palette_distances(
+        target_features['dominant_colors'],
+        target_features['color_weights']
+    )
+    hist_distances = bank.histogram_distances(_target_histogram(target_features), use_gpu=use_gpu)
+    
+    combined_distances = (
+        weights['deep_features'] * ai_distances +
+        weights['dominant_colors'] * color_distances +
+        weights['color_histogram'] * hist_distances
+    )
+    return combined_distances, {
+        'ai_dist': ai_distances,
+        'color_dist': color_distances,
+        'hist_dist': hist_distances
+    }
+
+
+def _ai_mobile_batch(target_features, bank, weights, use_gpu):
+    """ai_mobile for a whole FeatureBank; needs ResNet50 features for every image."""
+    if not target_features.get('mobile_available') or bank.mobile_features is None:
+        return None
+    
+    mobile_distances = feature_extractors.compute_ai_distances(target_features['mobile_features'], bank.mobile_features)
+    hash_distances = feature_extractors.hash_distance_u64_batch(target_features['ahash_u64'], bank.ahashes)
+    color_distances = bank.palette_distances(
+        target_features['dominant_colors'],
+        target_features['color_weights']
+    )
+    hist_distances = bank.histogram_distances(_target_histogram(target_features), use_gpu=use_gpu)
+    
+    combined_distances = (
+        weights['mobile_features'] * mobile_distances +
+        weights['dominant_colors'] * color_distances +
+        weights['color_histogram'] * hist_distances +
+        weights['perceptual_hash'] * hash_distances
+    )
+    return combined_distances, {
+        'mobile_dist': mobile_distances,
+        'color_dist': color_distances,
+        'hist_dist': hist_distances,
+        'hash_dist': hash_distances * 64
+    }
+
+
+# Algorithms with a vectorized FeatureBank path
+_BATCH_SCORERS = {
+    "color_distribution": _color_distribution_batch,
+    "fast": _fast_batch,
+    "skin_optimized": _skin_optimized_batch,
+    "ai_perceptual": _ai_perceptual_batch,
+    "ai_mobile": _ai_mobile_batch,
+}
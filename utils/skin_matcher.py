@@ -2,23 +2,128 @@
 File operations for skin matching and copying.
 """
 
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import lru_cache, partial
+import heapq
+from itertools import islice
+import multiprocessing
 import os
 from pathlib import Path
 import shutil
+import threading
 import time
-from .image_matcher import get_image_features, calculate_similarity
 
+import numpy as np
 
-def collect_all_files(root_dir):
-    """Recursively collect all files in a directory."""
-    all_files = []
-    for root, _, files in os.walk(root_dir):
-        for file_name in files:
-            all_files.append(os.path.join(root, file_name))
-    return all_files
+from .feature_bank import FeatureBank
+from .feature_cache import prune_cache
+from .feature_extractors import NUMBA_AVAILABLE
+from .image_matcher import get_image_features, get_image_features_batch, calculate_similarity, batch_calculate_distances
 
+# With parallel=True, candidate features are extracted in worker processes
+# for searches of at least this many files. Starting the pool (spawning each
+# worker, importing numpy/PIL and compiling the Numba kernels there) costs
+# seconds, about what extracting ~1000 skins serially takes.
+# Workers are spawned, not forked: batch scoring starts Numba and BLAS thread
+# pools in this process, and forking a process with live threads can hang.
+PARALLEL_MIN_FILES = 2000
+PARALLEL_CHUNKSIZE = 64
+# Chunks queued per worker; files are read from the walk only as chunks are
+# submitted, so memory doesn't grow with the size of the search
+PARALLEL_CHUNKS_PER_WORKER = 2
 
-def find_matching_skins(target_image_path, search_directory, top_n=5, algorithm="balanced", progress_callback=None, cancel_check=None):
+# Network-based algorithms stay in this process: every worker would load its
+# own copy of the model, and CUDA contexts don't survive a fork. Instead they
+# run the network over MODEL_BATCH_SIZE files at a time.
+SERIAL_ALGORITHMS = {"ai_perceptual", "ai_mobile"}
+MODEL_BATCH_SIZE = 64
+
+# Candidates are scored against the target this many at a time, with one
+# vectorized call (see image_matcher.batch_calculate_distances)
+SCORE_BATCH_SIZE = 256
+# A batch is scored early once collecting it takes this many seconds, so with
+# slow extraction (large files, slow disks) the matching loop, which checks
+# for cancellation and counts progress, still sees results several times a second
+SCORE_BATCH_SECONDS = 0.2
+
+# Without Numba, exact chi-squared over every candidate's histogram is the
+# costliest part of batch scoring. Batches are then scored with the Hellinger
+# surrogate (FeatureBank.histogram_distances), a few times cheaper and never
+# above the exact distance nor below half of it, and only used as a
+# prefilter: candidates that can still make the top N are rescored exactly.
+APPROXIMATE_HISTOGRAMS = not NUMBA_AVAILABLE
+
+# Files the matcher never opens. An allow-list of image extensions won't do:
+# launcher skin caches (assets/skins) store skins under extensionless hashes
+NON_IMAGE_EXTENSIONS = ('.txt', '.json', '.log', '.ini', '.db', '.ds_store', '.npz', '.tmp', '.zip', '.jar')
+
+# Seconds between progress updates during matching
+PROGRESS_INTERVAL = 0.25
+
+# Threads used by copy_skin_files
+COPY_WORKERS = 8
+
+
+def _scan_directory(path, exclude_extensions=()):
+    """
+    (files, subfolders) of one directory, leaving out files whose name ends
+    in one of exclude_extensions (lowercase). Uses os.scandir, whose entries
+    carry the file type from the directory listing, so no file is stat'ed
+    just to tell files from folders.
+    """
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    if not entry.name.lower().endswith(exclude_extensions):
+                        files.append(entry.path)
+                elif not entry.is_symlink():
+                    # Like os.walk, symlinked folders are not followed
+                    subdirs.append(entry.path)
+    except OSError:
+        # Unreadable folders are skipped, as os.walk does
+        return [], []
+    return files, subdirs
+
+
+def iter_all_files(root_dir, exclude_extensions=()):
+    """
+    Recursively yield all files in a directory, in os.walk order, except
+    those ending in one of exclude_extensions (lowercase).
+    """
+    pending = [root_dir]
+    while pending:
+        files, subdirs = _scan_directory(pending.pop(), exclude_extensions)
+        yield from files
+        # Reversed so the stack visits subfolders in listing order
+        pending.extend(reversed(subdirs))
+
+
+def parallel_iter_files(root_dir, max_workers=8, exclude_extensions=()):
+    """
+    Like iter_all_files, but lists up to max_workers folders at once. Much
+    faster on network drives, where every listing waits on the server, but
+    the files come in no fixed order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(_scan_directory, root_dir, exclude_extensions)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                yield from files
+                pending.update(executor.submit(_scan_directory, path, exclude_extensions) for path in subdirs)
+
+
+def find_matching_skins(target_image_path, search_directory, top_n=5, algorithm="balanced", progress_callback=None, cancel_check=None,
+                        use_cache=False, parallel=False):
     """
     Find the top N matching skins for a target image.
     
@@ -29,6 +134,12 @@ def find_matching_skins(target_image_path, search_directory, top_n=5, algorithm=
         algorithm: Matching algorithm to use ("balanced", "skin_optimized", "deep_features", "color_distribution", "fast")
         progress_callback: Optional callback function(current, total, message)
         cancel_check: Optional callback function that returns True if cancellation is requested
+        use_cache: Reuse features stored on disk by earlier runs, and store new ones
+            under ~/.skin_lookup (see utils.feature_cache). Off by default.
+        parallel: Extract features in worker processes when searching at least
+            PARALLEL_MIN_FILES files. Workers are spawned, so the calling script
+            needs an `if __name__ == "__main__":` guard (and a frozen app must call
+            multiprocessing.freeze_support()). Off by default.
         
     Returns:
         List of tuples: (distance, file_path, metrics)
@@ -40,7 +151,7 @@ def find_matching_skins(target_image_path, search_directory, top_n=5, algorithm=
         progress_callback(0, 0, "Extracting features from target image...")
     
     feature_start = time.time()
-    target_features, error = get_image_features(target_image_path, algorithm=algorithm)
+    target_features, error = _target_features(target_image_path, algorithm, use_cache)
     feature_time = time.time() - feature_start
     
     print(f"[DEBUG] Target features extraction complete in {feature_time:.2f}s. Success: {target_features is not None}")
@@ -51,8 +162,9 @@ def find_matching_skins(target_image_path, search_directory, top_n=5, algorithm=
     if progress_callback:
         progress_callback(0, 0, "Counting files...")
     
-    all_files = collect_all_files(search_directory)
-    total_files = len(all_files)
+    # Only counted here, with the order-free threaded walk; the paths are
+    # streamed into the matching loop below so they never all sit in memory
+    total_files = sum(1 for _ in parallel_iter_files(search_directory, exclude_extensions=NON_IMAGE_EXTENSIONS))
     
     if total_files == 0:
         return None, "No files found in search directory"
@@ -60,46 +172,232 @@ def find_matching_skins(target_image_path, search_directory, top_n=5, algorithm=
     if progress_callback:
         progress_callback(0, total_files, f"Found {total_files:,} files")
     
-    # Process files and find matches
-    top_matches = []
+    # Process files and find matches. The current top N are kept in a
+    # max-heap keyed on -distance, so heap[0] is the worst of them; idx breaks
+    # ties so metrics dicts are never compared.
+    heap = []
     processed_files = 0
     skipped_files = 0
-    start_time = time.time()
+    progress = _ProgressReporter(progress_callback, total_files)
     
-    for idx, file_path in enumerate(all_files, 1):
-        # Check for cancellation
-        if cancel_check and cancel_check():
-            return top_matches if top_matches else None, "Cancelled by user"
-        
-        candidate_features, error = get_image_features(file_path, algorithm=algorithm)
-        
-        if candidate_features is not None:
-            processed_files += 1
-            distance, metrics = calculate_similarity(target_features, candidate_features, algorithm=algorithm)
+    file_paths = iter_all_files(search_directory, exclude_extensions=NON_IMAGE_EXTENSIONS)
+    extract = partial(_extract_features, algorithm=algorithm, use_cache=use_cache)
+    executor = None
+    if algorithm in SERIAL_ALGORITHMS:
+        feature_results = _model_feature_results(file_paths, algorithm, use_cache)
+    elif parallel and total_files >= PARALLEL_MIN_FILES:
+        workers = os.cpu_count() or 1
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        feature_results = _bounded_map(executor, extract, file_paths, PARALLEL_CHUNKSIZE,
+                                       workers * PARALLEL_CHUNKS_PER_WORKER)
+    else:
+        feature_results = map(extract, file_paths)
+    results = _with_batch_distances(target_features, feature_results, algorithm, top_n)
+    
+    try:
+        for idx, (file_path, (candidate_features, error), batch_distance) in enumerate(results, 1):
+            # Check for cancellation
+            if cancel_check and cancel_check():
+                return _sorted_matches(heap) or None, "Cancelled by user"
             
-            # Keep track of top N matches
-            top_matches.append((distance, file_path, metrics))
-            top_matches.sort(key=lambda x: x[0])
-            top_matches = top_matches[:top_n]
-        else:
-            skipped_files += 1
-        
-        # Progress update - show every 10 files for AI algorithms, every 100 for others
-        update_interval = 10 if algorithm in ["ai_perceptual", "ai_mobile"] else 100
-        if progress_callback and (idx % update_interval == 0 or idx == total_files):
-            elapsed = time.time() - start_time
-            if idx > 0:
-                avg_time = elapsed / idx
-                files_per_sec = idx / elapsed
-                eta_seconds = avg_time * (total_files - idx)
-                eta_minutes = int(eta_seconds / 60)
-                eta_str = f"{eta_minutes}m {int(eta_seconds % 60)}s" if eta_minutes > 0 else f"{int(eta_seconds)}s"
-                progress_callback(idx, total_files, f"Processing ({files_per_sec:.1f} files/sec)... ETA: {eta_str}")
+            if candidate_features is not None:
+                processed_files += 1
+                if len(heap) < top_n:
+                    distance, metrics = calculate_similarity(target_features, candidate_features, algorithm=algorithm)
+                    heapq.heappush(heap, (-distance, idx, file_path, metrics))
+                elif heap and -batch_distance > heap[0][0]:
+                    # Metrics are only built for candidates that make the top N;
+                    # scoring stops early (inf) once the partial distance
+                    # exceeds the current Nth best
+                    distance, metrics = calculate_similarity(target_features, candidate_features, algorithm=algorithm,
+                                                             threshold=-heap[0][0])
+                    if -distance > heap[0][0]:
+                        heapq.heapreplace(heap, (-distance, idx, file_path, metrics))
+            else:
+                skipped_files += 1
+            
+            # Picked up by the reporter thread
+            progress.done = idx
+    finally:
+        progress.close()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if use_cache:
+            # Keeps the cache bounded now that this run may have added to it
+            prune_cache()
     
-    return top_matches, None
+    return _sorted_matches(heap), None
 
 
-def copy_skin_files(matches, output_directory, clear_existing=True):
+class _ProgressReporter:
+    """
+    Calls progress_callback every PROGRESS_INTERVAL seconds from a daemon
+    thread, with the rate and ETA for the file count in `done`. The matching
+    loop only stores that count, so it never times or formats anything.
+    """
+    
+    def __init__(self, progress_callback, total_files):
+        self.done = 0
+        self._callback = progress_callback
+        self._total_files = total_files
+        self._start_ns = time.monotonic_ns()
+        self._stop = threading.Event()
+        self._thread = None
+        if progress_callback:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        reported = 0
+        while not self._stop.wait(PROGRESS_INTERVAL):
+            done = self.done
+            if done != reported:
+                self._report(done)
+                reported = done
+    
+    def _report(self, done):
+        elapsed_ns = max(time.monotonic_ns() - self._start_ns, 1)
+        files_per_sec = done * 1e9 / elapsed_ns
+        # Integer math; files added since counting can't make it negative
+        eta_seconds = max(self._total_files - done, 0) * elapsed_ns // (done * 1_000_000_000)
+        eta_minutes, eta_rest = divmod(eta_seconds, 60)
+        eta_str = f"{eta_minutes}m {eta_rest}s" if eta_minutes > 0 else f"{eta_seconds}s"
+        self._callback(done, self._total_files, f"Processing ({files_per_sec:.1f} files/sec)... ETA: {eta_str}")
+    
+    def close(self):
+        """Stop the thread and send a last update with the final count."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        if self.done:
+            self._report(self.done)
+
+
+def _target_features(image_path, algorithm, use_cache):
+    """get_image_features for the target, memoized while the file is unchanged."""
+    try:
+        mtime_ns = os.stat(image_path).st_mtime_ns
+    except OSError:
+        # Let get_image_features report the error
+        return get_image_features(image_path, algorithm=algorithm, use_cache=use_cache)
+    try:
+        return _cached_target_features(image_path, mtime_ns, algorithm, use_cache), None
+    except _TargetFeaturesError as e:
+        return None, e.args[0]
+
+
+class _TargetFeaturesError(Exception):
+    """Raised by _cached_target_features so that failures are not memoized."""
+
+
+@lru_cache(maxsize=32)
+def _cached_target_features(image_path, mtime_ns, algorithm, use_cache):
+    """
+    Memoized per (path, mtime, algorithm), so matching the same target again
+    (e.g. with another top N or output folder) skips extracting it. The
+    features are shared between calls and must not be modified. Failures
+    raise instead, so a temporary one (file locked by an editor) is retried
+    on the next run.
+    """
+    features, error = get_image_features(image_path, algorithm=algorithm, use_cache=use_cache)
+    if features is None:
+        raise _TargetFeaturesError(error)
+    return features
+
+
+def _extract_features(file_path, algorithm, use_cache):
+    """(file_path, (features, error)) for one file; module level so worker processes can run it."""
+    return file_path, get_image_features(file_path, algorithm=algorithm, use_cache=use_cache)
+
+
+def _map_chunk(function, items):
+    """[function(item) for item in items]; module level so worker processes can run it."""
+    return [function(item) for item in items]
+
+
+def _bounded_map(executor, function, items, chunksize, max_pending):
+    """
+    Like executor.map(function, items, chunksize=chunksize), but items are
+    read lazily: at most max_pending chunks are submitted at a time, instead
+    of one future per chunk for the whole iterable up front. Results come
+    back in order.
+    """
+    items = iter(items)
+    pending = deque()
+    while True:
+        while len(pending) < max_pending:
+            chunk = list(islice(items, chunksize))
+            if not chunk:
+                break
+            pending.append(executor.submit(_map_chunk, function, chunk))
+        if not pending:
+            return
+        yield from pending.popleft().result()
+
+
+def _model_feature_results(file_paths, algorithm, use_cache):
+    """(file_path, (features, error)) for each file, running the network over MODEL_BATCH_SIZE files at a time."""
+    while True:
+        batch = list(islice(file_paths, MODEL_BATCH_SIZE))
+        if not batch:
+            return
+        yield from zip(batch, get_image_features_batch(batch, algorithm=algorithm, use_cache=use_cache))
+
+
+def _with_batch_distances(target_features, feature_results, algorithm, top_n):
+    """
+    Add the candidate's distance to the target to each (file_path, (features, error)),
+    scoring up to SCORE_BATCH_SIZE candidates per vectorized call (a single
+    matrix-vector product for the AI algorithms; see _next_batch). distance
+    is None for files that failed, and inf for candidates outside their
+    batch's top N, which can't make the overall top N either.
+    
+    With APPROXIMATE_HISTOGRAMS, distances are lower bounds on the exact
+    ones (at most twice as large), so the batch cutoff is doubled.
+    """
+    feature_results = iter(feature_results)
+    while True:
+        chunk = _next_batch(feature_results)
+        if not chunk:
+            return
+        candidates = [features for _, (features, _) in chunk if features is not None]
+        approximate = APPROXIMATE_HISTOGRAMS and bool(candidates) and 'hist_counts' in candidates[0]
+        if approximate:
+            candidates = FeatureBank.from_features(candidates, approximate_histograms=True)
+        distances = batch_calculate_distances(target_features, candidates, algorithm=algorithm) if candidates else []
+        if 0 < top_n < len(distances):
+            # Selecting the Nth best is O(n); candidates tied with it are kept
+            cutoff = np.partition(distances, top_n - 1)[top_n - 1]
+            if approximate:
+                cutoff *= 2
+            distances = np.where(distances <= cutoff, distances, np.inf)
+        distances = iter(np.asarray(distances).tolist())
+        for file_path, (features, error) in chunk:
+            yield file_path, (features, error), (next(distances) if features is not None else None)
+
+
+def _next_batch(feature_results):
+    """
+    The next SCORE_BATCH_SIZE items of feature_results, or fewer if
+    collecting them takes longer than SCORE_BATCH_SECONDS.
+    """
+    chunk = []
+    deadline = time.monotonic() + SCORE_BATCH_SECONDS
+    for result in feature_results:
+        chunk.append(result)
+        if len(chunk) >= SCORE_BATCH_SIZE or time.monotonic() >= deadline:
+            break
+    return chunk
+
+
+def _sorted_matches(heap):
+    """Heap entries as (distance, file_path, metrics) tuples, best first."""
+    return [(-neg_distance, file_path, metrics)
+            for neg_distance, _, file_path, metrics in sorted(heap, key=lambda entry: (-entry[0], entry[1]))]
+
+
+def copy_skin_files(matches, output_directory, clear_existing=True, hardlink=False):
     """
     Copy matched skin files to output directory.
     
@@ -107,6 +405,9 @@ def copy_skin_files(matches, output_directory, clear_existing=True):
         matches: List of (distance, file_path, metrics) tuples
         output_directory: Directory to copy files to
         clear_existing: Whether to clear existing files first
+        hardlink: Hard-link the files instead of copying them where possible
+            (same filesystem). Nothing is copied, but editing an output file
+            then also edits the original.
         
     Returns:
         List of successfully copied files
@@ -117,25 +418,53 @@ def copy_skin_files(matches, output_directory, clear_existing=True):
     
     # Clear existing files if requested
     if clear_existing:
-        for filename in os.listdir(output_directory):
-            file_path = os.path.join(output_directory, filename)
-            if os.path.isfile(file_path):
-                try:
-                    os.remove(file_path)
-                except:
-                    pass
+        with os.scandir(output_directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    try:
+                        os.remove(entry.path)
+                    except:
+                        pass
     
-    # Copy matched files
-    copied_files = []
-    for i, (distance, match_path, metrics) in enumerate(matches, 1):
+    def copy_match(i, match):
+        distance, match_path, metrics = match
         source_filename = os.path.basename(match_path)
         dest_filename = f"match_{i}_{source_filename}.png"
         dest_path = os.path.join(output_directory, dest_filename)
         
         try:
-            shutil.copy2(match_path, dest_path)
-            copied_files.append((dest_path, distance, metrics))
+            _copy_file(match_path, dest_path, hardlink)
+            return dest_path, distance, metrics
         except Exception as e:
             print(f"Error copying {source_filename}: {e}")
+            return None
     
-    return copied_files
+    # Copy matched files; copies mostly wait on IO, so several run at once
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+        results = list(executor.map(copy_match, range(1, len(matches) + 1), matches))
+    
+    return [copied for copied in results if copied is not None]
+
+
+def _copy_file(source, dest, hardlink):
+    """
+    Copy file contents only. shutil.copyfile skips copy2's metadata calls and
+    copies in the kernel (sendfile) on Linux.
+    """
+    if hardlink:
+        try:
+            os.link(source, dest)
+            return
+        except FileExistsError:
+            if os.path.samefile(source, dest):
+                # Already linked by an earlier run
+                return
+        except OSError:
+            # Other filesystem, or links unsupported: copy instead
+            pass
+    try:
+        shutil.copyfile(source, dest)
+    except shutil.SameFileError:
+        # dest is a hard link left by an earlier run; replace it with a copy
+        os.remove(dest)
+        shutil.copyfile(source, dest)
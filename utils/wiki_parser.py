@@ -9,6 +9,38 @@ from urllib.parse import urljoin
 from PIL import Image
 import io
 
+try:
+    import urllib3
+    URLLIB3_AVAILABLE = True
+except ImportError:
+    URLLIB3_AVAILABLE = False
+
+# Absolute PNG URLs, and relative ones in src or href attributes, in one pattern
+# so the page is scanned once
+_PNG_URL_RE = re.compile(r'(https://[^\s"<>]+\.png)|src="(/[^"]+\.png)"|href="(/[^"]+\.png)"')
+# Common non-mob images (logos, icons, UI elements)
+_EXCLUDE_RE = re.compile(r"logo|icon_|wiki|button|background|banner", re.IGNORECASE)
+# Common mob image keywords, for the render/skin fallback
+_SKIN_RE = re.compile(r"skyblock_npcs|skyblock_entities|skin|render|full|body", re.IGNORECASE)
+
+# Shared keep-alive connections, so the wiki page and its image (usually the
+# same host) are fetched over one TLS connection. Redirects are followed like
+# urlopen does, failed requests are not retried.
+_http_pool = urllib3.PoolManager(maxsize=4, retries=urllib3.Retry(connect=0, read=0, redirect=5)) if URLLIB3_AVAILABLE else None
+
+
+def _fetch(url, headers, timeout=10):
+    """GET a URL and return the response body; raises on HTTP errors like urlopen."""
+    if _http_pool is not None:
+        response = _http_pool.request('GET', url, headers=headers, timeout=timeout)
+        if response.status >= 400:
+            raise Exception(f"HTTP Error {response.status}: {response.reason}")
+        return response.data
+    
+    req = urllib.request.Request(url, headers=headers)
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return response.read()
+
 
 def parse_wiki_for_image(wiki_url, debug_callback=None):
     """
@@ -36,24 +68,24 @@ def parse_wiki_for_image(wiki_url, debug_callback=None):
         debug_log(f"Page name extracted: {page_name}")
         
         # Download the wiki page with User-Agent header
-        req = urllib.request.Request(
+        html = _fetch(
             wiki_url,
             headers={
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
-        )
-        
-        with urllib.request.urlopen(req, timeout=10) as response:
-            html = response.read().decode('utf-8')
-            debug_log(f"Downloaded HTML page ({len(html)} chars)")
-        
-        # Find both absolute and relative PNG URLs
-        # Pattern 1: Absolute URLs
-        absolute_pngs = re.findall(r'https://[^\s"<>]+\.png', html)
-        # Pattern 2: Relative URLs in src attributes
-        relative_pngs = re.findall(r'src="(/[^"]+\.png)"', html)
-        # Pattern 3: Relative URLs in href attributes
-        relative_href_pngs = re.findall(r'href="(/[^"]+\.png)"', html)
+        ).decode('utf-8')
+        debug_log(f"Downloaded HTML page ({len(html)} chars)")
+        
+        # Find both absolute and relative PNG URLs in a single pass; each
+        # kind is kept in its own list, absolute URLs taking priority
+        absolute_pngs, relative_pngs, relative_href_pngs = [], [], []
+        for absolute_url, src_url, href_url in _PNG_URL_RE.findall(html):
+            if absolute_url:
+                absolute_pngs.append(absolute_url)
+            elif src_url:
+                relative_pngs.append(src_url)
+            else:
+                relative_href_pngs.append(href_url)
         
         # Convert relative URLs to absolute
         base_url = 'https://wiki.hypixel.net'
@@ -65,8 +97,7 @@ def parse_wiki_for_image(wiki_url, debug_callback=None):
             raise Exception("Could not find any skin images on the wiki page")
         
         # Filter out common non-mob images (logos, icons, UI elements)
-        exclude_keywords = ['logo', 'icon_', 'wiki', 'button', 'background', 'banner']
-        filtered_matches = [img for img in png_matches if not any(keyword in img.lower() for keyword in exclude_keywords)]
+        filtered_matches = [img for img in png_matches if not _EXCLUDE_RE.search(img)]
         debug_log(f"After filtering UI elements: {len(filtered_matches)} PNG URLs")
         
         # If filtering removed all images, keep the original list
@@ -90,7 +121,7 @@ def parse_wiki_for_image(wiki_url, debug_callback=None):
             # FALLBACK: No sprite matching page name, use render/skin image
             debug_log(f"No sprite found matching '{page_name}', falling back to render/skin images")
             # Look for images with page name OR common mob image keywords
-            skin_images = [img for img in filtered_matches if (page_name in img.lower() or any(keyword in img.lower() for keyword in ['skyblock_npcs', 'skyblock_entities', 'skin', 'render', 'full', 'body']))]
+            skin_images = [img for img in filtered_matches if page_name in img.lower() or _SKIN_RE.search(img)]
             debug_log(f"Filtered to {len(skin_images)} likely skin/render images")
             
             # If no specific skin images found, use the first image from filtered list
@@ -106,14 +137,11 @@ def parse_wiki_for_image(wiki_url, debug_callback=None):
         
         # Download the image
         debug_log(f"Downloading image from URL: {image_url}")
-        req = urllib.request.Request(
+        image_data = _fetch(
             image_url,
             headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
         )
         
-        with urllib.request.urlopen(req, timeout=10) as response:
-            image_data = response.read()
-        
         # Load image
         img = Image.open(io.BytesIO(image_data))
         debug_log(f"Successfully loaded image: {img.size} {img.mode}")
@@ -146,14 +174,11 @@ def download_image_from_url(url, debug_callback=None):
     try:
         debug_log(f"Downloading image from URL: {url}")
         
-        req = urllib.request.Request(
+        image_data = _fetch(
             url,
             headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
         )
         
-        with urllib.request.urlopen(req, timeout=10) as response:
-            image_data = response.read()
-        
         img = Image.open(io.BytesIO(image_data))
         debug_log(f"Successfully downloaded image: {img.size} {img.mode}")
         